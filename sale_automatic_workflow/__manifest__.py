@@ -18,6 +18,8 @@
         "security/ir.model.access.csv",
         "views/sale_view.xml",
         "views/sale_workflow_process_view.xml",
+        "views/automatic_workflow_job_log_view.xml",
+        "wizards/sale_workflow_process_plan_view.xml",
         "data/automatic_workflow_data.xml",
     ],
 }
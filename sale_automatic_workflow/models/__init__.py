@@ -1,5 +1,8 @@
 from . import account_move
 from . import automatic_workflow_job
+from . import automatic_workflow_job_log
+from . import automatic_workflow_job_pending
+from . import ir_config_parameter
 from . import sale_order
 from . import sale_workflow_process
 from . import stock_move
@@ -3,7 +3,7 @@
 # Copyright 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from odoo import api, fields, models
 
 
 class AccountMove(models.Model):
@@ -12,3 +12,17 @@ class AccountMove(models.Model):
     workflow_process_id = fields.Many2one(
         comodel_name="sale.workflow.process", string="Sale Workflow Process"
     )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        self.env["automatic.workflow.job.pending"]._enqueue(moves)
+        return moves
+
+    def write(self, vals):
+        res = super().write(vals)
+        pending = self.env["automatic.workflow.job.pending"]
+        if ("state" in vals or "workflow_process_id" in vals) and pending._is_enabled():
+            pending._enqueue(self)
+            pending._enqueue(self.mapped("line_ids.sale_line_ids.order_id"))
+        return res
@@ -4,13 +4,72 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
+from psycopg2 import sql
+
+import odoo
 from odoo import api, models
-from odoo.tools.safe_eval import safe_eval
+from odoo.tools import split_every
 
 _logger = logging.getLogger(__name__)
 
+# Steps of a workflow, in the order they are played by the job
+WORKFLOW_STEPS = (
+    "validate_order",
+    "validate_picking",
+    "create_invoice",
+    "validate_invoice",
+    "sale_done",
+)
+# Size of the chunks dispatched to the workers when the workflow
+# has no batch size
+DEFAULT_CHUNK_SIZE = 100
+
+
+def percentile(values, rank):
+    """Return the nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(math.ceil(rank / 100.0 * len(values))) - 1
+    return values[max(index, 0)]
+
+
+class StepStats(object):
+    """Outcome of a workflow step, returned by the step methods"""
+
+    def __init__(self, candidate_count=0):
+        self.candidate_count = candidate_count
+        self.done_count = 0
+        self.bypassed_count = 0
+        self.failed_count = 0
+        # per-record latencies, in seconds
+        self.latencies = []
+
+    def add_result(self, result, duration):
+        """Record the outcome of a ``_do_*`` method on a single record
+
+        ``result`` is the message returned by the method, or None when
+        it raised.
+        """
+        if result is None:
+            self.failed_count += 1
+        elif result.endswith("job bypassed"):
+            self.bypassed_count += 1
+        else:
+            self.done_count += 1
+        self.latencies.append(duration)
+
+    def add_batch(self, count, duration):
+        """Record a batch of records processed successfully"""
+        self.done_count += count
+        self.latencies += [duration / count] * count
+
 
 @contextmanager
 def savepoint(cr):
@@ -25,16 +84,6 @@ def savepoint(cr):
         _logger.exception("Error during an automatic workflow action.")
 
 
-@contextmanager
-def force_company(env, company_id):
-    user_company = env.user.company_id
-    env.user.update({"company_id": company_id})
-    try:
-        yield
-    finally:
-        env.user.update({"company_id": user_company})
-
-
 class AutomaticWorkflowJob(models.Model):
     """ Scheduler that will play automatically the validation of
     invoices, pickings...  """
@@ -45,131 +94,682 @@ class AutomaticWorkflowJob(models.Model):
         " invoices, pickings..."
     )
 
+    def _get_domain_query(self, model_name, domain):
+        """Compile a domain in SQL, once for all the records of a step
+
+        The relational subdomains are resolved to ids by the compilation,
+        so the query is only kept for the duration of a step, in the
+        ``automatic_workflow_domain_queries`` dict of the context given by
+        ``_run_step``.
+
+        Return the FROM and WHERE clauses and the parameters of the query.
+        """
+        queries = self.env.context.get("automatic_workflow_domain_queries")
+        key = (
+            self.env.uid,
+            self.env.su,
+            self.env.lang,
+            self.env.context.get("active_test", True),
+            tuple(self.env.context.get("allowed_company_ids") or ()),
+            model_name,
+            str(domain),
+        )
+        if queries is not None and key in queries:
+            return queries[key]
+        model = self.env[model_name]
+        query = model._where_calc(domain)
+        model._apply_ir_rules(query, "read")
+        from_clause, where_clause, where_params = query.get_sql()
+        result = (from_clause, where_clause or "TRUE", tuple(where_params))
+        if queries is not None:
+            queries[key] = result
+        return result
+
+    def _batch_filter(self, records, domain_filter):
+        """Return the records of a batch still matching the domain
+
+        The domain is compiled once by ``_get_domain_query`` and a single
+        query checks the whole batch, it ensures no duplication.
+        """
+        if not records:
+            return records
+        records._flush_search(domain_filter)
+        from_clause, where_clause, where_params = self._get_domain_query(
+            records._name, domain_filter
+        )
+        # the clauses are generated by the ORM, only ids are added
+        query = (
+            'SELECT "{table}".id FROM {from_} WHERE ({where}) AND "{table}".id IN %s'
+        )
+        self.env.cr.execute(
+            query.format(table=records._table, from_=from_clause, where=where_clause),
+            where_params + (tuple(records.ids),),
+        )
+        matching_ids = {row[0] for row in self.env.cr.fetchall()}
+        return records.filtered(lambda r: r.id in matching_ids)
+
+    def _with_company(self, company):
+        """Return the job in the context of a company
+
+        The records of a company are processed with the company as current
+        company (``allowed_company_ids``) instead of changing the company
+        of the user, which would be written on each record.
+        """
+        if not company:
+            return self
+        allowed_companies = company | self.env.user.company_ids
+        return self.with_context(
+            allowed_company_ids=[company.id] + (allowed_companies - company).ids,
+            force_company=company.id,
+        )
+
+    def _process_records(
+        self,
+        records,
+        domain_filter,
+        do_method_name,
+        do_batch_method_name,
+        batch_size=0,
+        company_dependent=True,
+    ):
+        """Apply a workflow action on records
+
+        The records are partitioned by company, each partition being
+        processed in the context of its company.
+
+        Without batch size, the ``do_method_name`` method is called record
+        by record, each one in its own savepoint.
+
+        With a batch size, the records are processed by chunks: each chunk
+        is re-validated with a single query and given as a recordset to the
+        ``do_batch_method_name`` method. When a batch raises, its records
+        are processed again one by one to isolate the failing one.
+
+        Return a ``StepStats`` with the outcome of the action.
+        """
+        stats = StepStats(candidate_count=len(records))
+        if company_dependent:
+            companies = records.mapped("company_id")
+        else:
+            companies = [self.env["res.company"]]
+        for company in companies:
+            job = self._with_company(company)
+            if company:
+                company_records = records.filtered(lambda r: r.company_id == company)
+            else:
+                company_records = records
+            company_records = company_records.with_env(job.env)
+            do_method = getattr(job, do_method_name)
+            if not batch_size:
+                for record in company_records:
+                    job._process_record(record, domain_filter, do_method, stats)
+                continue
+            job._process_batches(
+                company_records,
+                domain_filter,
+                do_method,
+                getattr(job, do_batch_method_name),
+                batch_size,
+                stats,
+            )
+        return stats
+
+    def _process_batches(
+        self, records, domain_filter, do_method, do_batch_method, batch_size, stats
+    ):
+        for batch_ids in split_every(batch_size, records.ids):
+            batch = self._batch_filter(records.browse(batch_ids), domain_filter)
+            if len(batch) < len(batch_ids):
+                stats.bypassed_count += len(batch_ids) - len(batch)
+                _logger.debug(
+                    "%s %s job bypassed",
+                    records._name,
+                    sorted(set(batch_ids) - set(batch.ids)),
+                )
+            if not batch:
+                continue
+            start = time.perf_counter()
+            # the savepoint neither flushes nor invalidates the cache: the
+            # pending writes must not survive a rollback of the batch
+            self.flush()
+            try:
+                with self.env.cr.savepoint():
+                    do_batch_method(batch)
+                    self.flush()
+            except Exception:
+                self.env.clear()
+                _logger.warning(
+                    "Error during an automatic workflow action on %s %s, "
+                    "processing them one by one.",
+                    batch._name,
+                    batch.ids,
+                    exc_info=True,
+                )
+                unhandled = batch
+            else:
+                # an action can return without processing the records, like
+                # the confirmation of orders having sale exceptions
+                unhandled = self._batch_filter(batch, domain_filter)
+                if len(unhandled) < len(batch):
+                    stats.add_batch(
+                        len(batch) - len(unhandled), time.perf_counter() - start
+                    )
+                if unhandled:
+                    _logger.debug(
+                        "%s %s not processed in batch, processing them one by one.",
+                        unhandled._name,
+                        unhandled.ids,
+                    )
+            for record in unhandled:
+                self._process_record(record, domain_filter, do_method, stats)
+
+    def _process_record(self, record, domain_filter, do_method, stats):
+        """Apply a workflow action on a single record in its own savepoint"""
+        start = time.perf_counter()
+        result = None
+        with savepoint(self.env.cr):
+            result = do_method(record, domain_filter)
+        stats.add_result(result, time.perf_counter() - start)
+
+    @api.model
+    def _search_step_records(self, model_name, domain, ids=None):
+        """Search the candidates of a step, restricted to ``ids`` if given
+
+        The restriction is kept out of the domain used to filter the
+        records, which is compiled once for all the records of the step.
+        """
+        if ids is not None:
+            domain = domain + [("id", "in", list(ids))]
+        return self.env[model_name].search(domain)
+
     def _do_validate_sale_order(self, sale, domain_filter):
         """Validate a sales order, filter ensure no duplication"""
-        if not self.env["sale.order"].search_count(
-            [("id", "=", sale.id)] + domain_filter
-        ):
+        if not self._batch_filter(sale, domain_filter):
             return "{} {} job bypassed".format(sale.display_name, sale)
         sale.action_confirm()
         return "{} {} confirmed successfully".format(sale.display_name, sale)
 
+    def _do_validate_sale_order_batch(self, sales):
+        """Validate a batch of sales orders, already filtered"""
+        sales.action_confirm()
+        return "{} confirmed successfully".format(sales)
+
     @api.model
-    def _validate_sale_orders(self, order_filter):
-        sale_obj = self.env["sale.order"]
-        sales = sale_obj.search(order_filter)
+    def _validate_sale_orders(self, order_filter, batch_size=0, ids=None):
+        sales = self._search_step_records("sale.order", order_filter, ids=ids)
         _logger.debug("Sale Orders to validate: %s", sales.ids)
-        for sale in sales:
-            with savepoint(self.env.cr), force_company(self.env, sale.company_id):
-                self._do_validate_sale_order(sale, order_filter)
+        return self._process_records(
+            sales,
+            order_filter,
+            "_do_validate_sale_order",
+            "_do_validate_sale_order_batch",
+            batch_size=batch_size,
+        )
 
     def _do_create_invoice(self, sale, domain_filter):
         """Create an invoice for a sales order, filter ensure no duplication"""
-        if not self.env["sale.order"].search_count(
-            [("id", "=", sale.id)] + domain_filter
-        ):
+        if not self._batch_filter(sale, domain_filter):
             return "{} {} job bypassed".format(sale.display_name, sale)
         payment = self.env["sale.advance.payment.inv"].create({})
         payment.with_context(active_ids=sale.ids).create_invoices()
         return "{} {} create invoice successfully".format(sale.display_name, sale)
 
+    def _do_create_invoice_batch(self, sales):
+        """Create the invoices for a batch of sales orders, already filtered
+
+        The invoices are grouped by sales order, as when they are created
+        one by one through the ``sale.advance.payment.inv`` wizard.
+        """
+        sales._create_invoices(grouped=True, final=True)
+        return "{} create invoice successfully".format(sales)
+
     @api.model
-    def _create_invoices(self, create_filter):
-        sale_obj = self.env["sale.order"]
-        sales = sale_obj.search(create_filter)
+    def _create_invoices(self, create_filter, batch_size=0, ids=None):
+        sales = self._search_step_records("sale.order", create_filter, ids=ids)
         _logger.debug("Sale Orders to create Invoice: %s", sales.ids)
-        for sale in sales:
-            with savepoint(self.env.cr), force_company(self.env, sale.company_id):
-                self._do_create_invoice(sale, create_filter)
+        return self._process_records(
+            sales,
+            create_filter,
+            "_do_create_invoice",
+            "_do_create_invoice_batch",
+            batch_size=batch_size,
+        )
 
     def _do_validate_invoice(self, invoice, domain_filter):
         """Validate an invoice, filter ensure no duplication"""
-        if not self.env["account.move"].search_count(
-            [("id", "=", invoice.id)] + domain_filter
-        ):
+        if not self._batch_filter(invoice, domain_filter):
             return "{} {} job bypassed".format(invoice.display_name, invoice)
         invoice.with_context(force_company=invoice.company_id.id).post()
         return "{} {} validate invoice successfully".format(
             invoice.display_name, invoice
         )
 
+    def _do_validate_invoice_batch(self, invoices):
+        """Validate a batch of invoices of the same company, already filtered"""
+        invoices.with_context(force_company=invoices[:1].company_id.id).post()
+        return "{} validate invoice successfully".format(invoices)
+
     @api.model
-    def _validate_invoices(self, validate_invoice_filter):
-        move_obj = self.env["account.move"]
-        invoices = move_obj.search(validate_invoice_filter)
+    def _validate_invoices(self, validate_invoice_filter, batch_size=0, ids=None):
+        invoices = self._search_step_records(
+            "account.move", validate_invoice_filter, ids=ids
+        )
         _logger.debug("Invoices to validate: %s", invoices.ids)
-        for invoice in invoices:
-            with savepoint(self.env.cr), force_company(self.env, invoice.company_id):
-                self._do_validate_invoice(invoice, validate_invoice_filter)
+        return self._process_records(
+            invoices,
+            validate_invoice_filter,
+            "_do_validate_invoice",
+            "_do_validate_invoice_batch",
+            batch_size=batch_size,
+        )
 
     def _do_validate_picking(self, picking, domain_filter):
         """Validate a stock.picking, filter ensure no duplication"""
-        if not self.env["stock.picking"].search_count(
-            [("id", "=", picking.id)] + domain_filter
-        ):
+        if not self._batch_filter(picking, domain_filter):
             return "{} {} job bypassed".format(picking.display_name, picking)
         picking.validate_picking()
         return "{} {} validate picking successfully".format(
             picking.display_name, picking
         )
 
+    def _do_validate_picking_batch(self, pickings):
+        """Validate a batch of stock.picking, already filtered"""
+        pickings.validate_picking_bulk()
+        return "{} validate picking successfully".format(pickings)
+
     @api.model
-    def _validate_pickings(self, picking_filter):
-        picking_obj = self.env["stock.picking"]
-        pickings = picking_obj.search(picking_filter)
+    def _validate_pickings(self, picking_filter, batch_size=0, ids=None):
+        pickings = self._search_step_records("stock.picking", picking_filter, ids=ids)
         _logger.debug("Pickings to validate: %s", pickings.ids)
-        for picking in pickings:
-            with savepoint(self.env.cr):
-                self._do_validate_picking(picking, picking_filter)
+        return self._process_records(
+            pickings,
+            picking_filter,
+            "_do_validate_picking",
+            "_do_validate_picking_batch",
+            batch_size=batch_size,
+            company_dependent=False,
+        )
 
     def _do_sale_done(self, sale, domain_filter):
         """Set a sales order to done, filter ensure no duplication"""
-        if not self.env["sale.order"].search_count(
-            [("id", "=", sale.id)] + domain_filter
-        ):
+        if not self._batch_filter(sale, domain_filter):
             return "{} {} job bypassed".format(sale.display_name, sale)
         sale.action_done()
         return "{} {} set done successfully".format(sale.display_name, sale)
 
+    def _do_sale_done_batch(self, sales):
+        """Set a batch of sales orders to done, already filtered"""
+        sales.action_done()
+        return "{} set done successfully".format(sales)
+
     @api.model
-    def _sale_done(self, sale_done_filter):
-        sale_obj = self.env["sale.order"]
-        sales = sale_obj.search(sale_done_filter)
+    def _sale_done(self, sale_done_filter, batch_size=0, ids=None):
+        sales = self._search_step_records("sale.order", sale_done_filter, ids=ids)
         _logger.debug("Sale Orders to done: %s", sales.ids)
-        for sale in sales:
-            with savepoint(self.env.cr), force_company(self.env, sale.company_id):
-                self._do_sale_done(sale, sale_done_filter)
+        return self._process_records(
+            sales,
+            sale_done_filter,
+            "_do_sale_done",
+            "_do_sale_done_batch",
+            batch_size=batch_size,
+        )
 
     @api.model
-    def run_with_workflow(self, sale_workflow):
+    def _workflow_steps(self, sale_workflow):
+        """Return the steps enabled on a workflow, in the order to play them
+
+        Each step is a tuple ``(step, model name, method name, domain)``,
+        the method being called with the domain and the batch size.
+        """
         workflow_domain = [("workflow_process_id", "=", sale_workflow.id)]
+        steps = []
         if sale_workflow.validate_order:
-            self._validate_sale_orders(
-                safe_eval(sale_workflow.order_filter_id.domain) + workflow_domain
+            steps.append(
+                (
+                    "validate_order",
+                    "sale.order",
+                    "_validate_sale_orders",
+                    sale_workflow._get_filter_domain("order_filter_id")
+                    + workflow_domain,
+                )
             )
         if sale_workflow.validate_picking:
-            self._validate_pickings(
-                safe_eval(sale_workflow.picking_filter_id.domain) + workflow_domain
+            steps.append(
+                (
+                    "validate_picking",
+                    "stock.picking",
+                    "_validate_pickings",
+                    sale_workflow._get_filter_domain("picking_filter_id")
+                    + workflow_domain,
+                )
             )
         if sale_workflow.create_invoice:
-            self._create_invoices(
-                safe_eval(sale_workflow.create_invoice_filter_id.domain)
-                + workflow_domain
+            steps.append(
+                (
+                    "create_invoice",
+                    "sale.order",
+                    "_create_invoices",
+                    sale_workflow._get_filter_domain("create_invoice_filter_id")
+                    + workflow_domain,
+                )
             )
         if sale_workflow.validate_invoice:
-            self._validate_invoices(
-                safe_eval(sale_workflow.validate_invoice_filter_id.domain)
-                + workflow_domain
+            steps.append(
+                (
+                    "validate_invoice",
+                    "account.move",
+                    "_validate_invoices",
+                    sale_workflow._get_filter_domain("validate_invoice_filter_id")
+                    + workflow_domain,
+                )
             )
         if sale_workflow.sale_done:
-            self._sale_done(
-                safe_eval(sale_workflow.sale_done_filter_id.domain) + workflow_domain
+            steps.append(
+                (
+                    "sale_done",
+                    "sale.order",
+                    "_sale_done",
+                    sale_workflow._get_filter_domain("sale_done_filter_id")
+                    + workflow_domain,
+                )
+            )
+        return steps
+
+    @api.model
+    def _run_step(self, sale_workflow, step, method_name, domain, ids=None):
+        """Play a step of a workflow, restricted to ``ids`` if given
+
+        The outcome, timings and number of queries of the step are stored
+        in a ``automatic.workflow.job.log``.
+        """
+        start = time.perf_counter()
+        query_count = self.env.cr.sql_log_count
+        job = self.with_context(automatic_workflow_domain_queries={})
+        stats = getattr(job, method_name)(
+            domain, batch_size=sale_workflow.batch_size, ids=ids
+        )
+        if stats is not None:
+            self.env["automatic.workflow.job.log"]._log_step(
+                sale_workflow,
+                step,
+                domain,
+                stats,
+                time.perf_counter() - start,
+                self.env.cr.sql_log_count - query_count,
+            )
+        return stats
+
+    @api.model
+    def run_with_workflow(self, sale_workflow):
+        for step, __, method_name, domain in self._workflow_steps(sale_workflow):
+            self._run_step(sale_workflow, step, method_name, domain)
+
+    @api.model
+    def _get_time_budget(self):
+        """Maximum duration of a run of the job in seconds, 0 for no limit"""
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("sale_automatic_workflow.time_budget", 0))
+
+    @api.model
+    def _with_time_budget(self):
+        """Return the job with the deadline of the run in its context"""
+        time_budget = self._get_time_budget()
+        if not time_budget:
+            return self
+        return self.with_context(
+            automatic_workflow_deadline=time.monotonic() + time_budget
+        )
+
+    def _is_budget_exhausted(self):
+        deadline = self.env.context.get("automatic_workflow_deadline")
+        return bool(deadline) and time.monotonic() >= deadline
+
+    def _commit(self):
+        """Commit the work done so far, the tests cannot commit"""
+        if not getattr(threading.currentThread(), "testing", False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    @api.model
+    def _run_step_chunks(self, sale_workflow, step, method_name, domain, ids):
+        """Play a step of a workflow by chunks, committing after each one
+
+        Return False when the time budget is exhausted before the end of
+        the step, the remaining records being left for the next run.
+        """
+        chunk_size = sale_workflow.batch_size or DEFAULT_CHUNK_SIZE
+        for chunk_ids in split_every(chunk_size, ids):
+            if self._is_budget_exhausted():
+                _logger.info(
+                    "Automatic workflow time budget exhausted during step %s "
+                    "of %s, stopping.",
+                    step,
+                    sale_workflow.display_name,
+                )
+                return False
+            self._run_step(sale_workflow, step, method_name, domain, ids=chunk_ids)
+            self._commit()
+        return True
+
+    @api.model
+    def _run_with_budget(self, sale_workflows):
+        """Play the workflows by priority until the time budget is exhausted
+
+        As the records processed no longer match the filters, the next run
+        resumes with the remaining ones.
+        """
+        for sale_workflow in sale_workflows:
+            workflow_steps = self._workflow_steps(sale_workflow)
+            for step, model_name, method_name, domain in workflow_steps:
+                ids = self.env[model_name].search(domain).ids
+                if not self._run_step_chunks(
+                    sale_workflow, step, method_name, domain, ids
+                ):
+                    return False
+        return True
+
+    @api.model
+    def _get_worker_count(self):
+        """Number of workers used to dispatch the job, 1 runs it serially"""
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        worker_count = int(get_param("sale_automatic_workflow.worker_count", 1))
+        if getattr(threading.currentThread(), "testing", False):
+            # workers use their own cursor, they would not see the test data
+            return 1
+        return max(worker_count, 1)
+
+    @api.model
+    def _claim_records(self, model_name, ids):
+        """Lock the given records and return the ids of the ones we got
+
+        Records already locked by another worker are skipped, so two
+        workers never process the same record.
+        """
+        query = sql.SQL("SELECT id FROM {} WHERE id IN %s FOR UPDATE SKIP LOCKED")
+        self.env.cr.execute(
+            query.format(sql.Identifier(self.env[model_name]._table)), (tuple(ids),)
+        )
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _search_pending_ids(self, model_name, domain):
+        """Search the records of a step in a new cursor
+
+        The cron cursor keeps the snapshot taken at its first query, it
+        would not see the records committed by the workers in the
+        previous steps.
+        """
+        with odoo.registry(self.env.cr.dbname).cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            return env[model_name].search(domain).ids
+
+    @api.model
+    def _run_chunk(self, sale_workflow_id, step, model_name, method_name, domain, ids):
+        """Process a chunk of a step in its own transaction
+
+        Called from a worker thread: opens a new cursor, claims the
+        records of the chunk and commits once they are processed.
+        """
+        dbname = self.env.cr.dbname
+        uid, context = self.env.uid, self.env.context
+        threading.currentThread().dbname = dbname
+        if self._is_budget_exhausted():
+            return
+        with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+            job = api.Environment(cr, uid, context)[self._name]
+            claimed_ids = job._claim_records(model_name, ids)
+            if len(claimed_ids) < len(ids):
+                _logger.debug(
+                    "%s %s skipped, locked by another worker",
+                    model_name,
+                    sorted(set(ids) - set(claimed_ids)),
+                )
+            if claimed_ids:
+                sale_workflow = job.env["sale.workflow.process"].browse(
+                    sale_workflow_id
+                )
+                job._run_step(sale_workflow, step, method_name, domain, ids=claimed_ids)
+
+    @api.model
+    def _run_parallel(self, sale_workflows, worker_count):
+        """Dispatch the pending records of each step on a pool of workers
+
+        Steps are played one after the other, each one being split in
+        chunks executed in independent transactions by the workers. The
+        chunks not started when the time budget is exhausted are skipped.
+
+        Return False when the time budget is exhausted.
+        """
+        steps = {
+            sale_workflow: self._workflow_steps(sale_workflow)
+            for sale_workflow in sale_workflows
+        }
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            for step in WORKFLOW_STEPS:
+                if self._is_budget_exhausted():
+                    return False
+                futures = []
+                for sale_workflow, workflow_steps in steps.items():
+                    chunk_size = sale_workflow.batch_size or DEFAULT_CHUNK_SIZE
+                    for name, model_name, method_name, domain in workflow_steps:
+                        if name != step:
+                            continue
+                        ids = self._search_pending_ids(model_name, domain)
+                        for chunk_ids in split_every(chunk_size, ids):
+                            futures.append(
+                                executor.submit(
+                                    self._run_chunk,
+                                    sale_workflow.id,
+                                    step,
+                                    model_name,
+                                    method_name,
+                                    domain,
+                                    chunk_ids,
+                                )
+                            )
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception:
+                        _logger.exception(
+                            "Error during an automatic workflow chunk of step %s.",
+                            step,
+                        )
+        return not self._is_budget_exhausted()
+
+    @api.model
+    def run_incremental(self):
+        """ Must be called from ir.cron
+
+        Only process the records enqueued by a state change since the
+        previous run, the queue being read again before each step to get
+        the records created or modified by the previous steps.
+        """
+        job = self._with_time_budget()
+        pending = self.env["automatic.workflow.job.pending"]
+        sale_workflows = self.env["sale.workflow.process"].search([])
+        steps = {
+            sale_workflow: job._workflow_steps(sale_workflow)
+            for sale_workflow in sale_workflows
+        }
+        read_dates = {}
+        for step in WORKFLOW_STEPS:
+            for sale_workflow, workflow_steps in steps.items():
+                for name, model_name, method_name, domain in workflow_steps:
+                    if name != step:
+                        continue
+                    ids, read_date = pending._read_queue(model_name)
+                    # only dequeue the records enqueued before the first read,
+                    # the ones enqueued later missed the previous steps
+                    read_dates.setdefault(model_name, read_date)
+                    if not ids:
+                        continue
+                    if not job._run_step_chunks(
+                        sale_workflow, step, method_name, domain, ids
+                    ):
+                        # keep the queue for the next run
+                        return True
+        for model_name, read_date in read_dates.items():
+            pending._dequeue(model_name, read_date)
+        return True
+
+    @api.model
+    def _update_crons(self):
+        """Set the scheduled actions of the job according to its mode
+
+        In incremental mode, the incremental job runs every minute and the
+        full job only every hour, as a reconciliation sweep. Otherwise, the
+        full job runs every minute.
+        """
+        incremental = self.env["automatic.workflow.job.pending"]._is_enabled()
+        full_cron = self.env.ref(
+            "sale_automatic_workflow.ir_cron_automatic_workflow_job",
+            raise_if_not_found=False,
+        )
+        incremental_cron = self.env.ref(
+            "sale_automatic_workflow.ir_cron_automatic_workflow_job_incremental",
+            raise_if_not_found=False,
+        )
+        if full_cron:
+            full_cron.sudo().write(
+                {
+                    "interval_number": 1,
+                    "interval_type": "hours" if incremental else "minutes",
+                }
             )
+        if incremental_cron:
+            incremental_cron.sudo().active = incremental
+
+    @api.model
+    def _full_run(self):
+        """Play all the workflows, by priority
+
+        Return False when the time budget is exhausted before the end.
+        """
+        sale_workflows = self.env["sale.workflow.process"].search([])
+        job = self._with_time_budget()
+        worker_count = job._get_worker_count()
+        if worker_count > 1:
+            return job._run_parallel(sale_workflows, worker_count)
+        if job._get_time_budget():
+            return job._run_with_budget(sale_workflows)
+        for sale_workflow in sale_workflows:
+            job.run_with_workflow(sale_workflow)
+        return True
 
     @api.model
     def run(self):
         """ Must be called from ir.cron """
-        sale_workflow_process = self.env["sale.workflow.process"]
-        for sale_workflow in sale_workflow_process.search([]):
-            self.run_with_workflow(sale_workflow)
+        pending = self.env["automatic.workflow.job.pending"]
+        if not pending._is_enabled():
+            self._full_run()
+            return True
+        # full reconciliation sweep of the incremental mode: the records
+        # enqueued before it are processed by it
+        read_dates = {
+            model_name: pending._read_queue(model_name)[1]
+            for model_name in ("sale.order", "stock.picking", "account.move")
+        }
+        if self._full_run():
+            for model_name, read_date in read_dates.items():
+                pending._dequeue(model_name, read_date)
         return True
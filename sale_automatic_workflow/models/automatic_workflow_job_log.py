@@ -0,0 +1,98 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from .automatic_workflow_job import percentile
+
+STEP_SELECTION = [
+    ("validate_order", "Validate Order"),
+    ("validate_picking", "Confirm and Transfer Picking"),
+    ("create_invoice", "Create Invoice"),
+    ("validate_invoice", "Validate Invoice"),
+    ("sale_done", "Sale Done"),
+]
+
+
+class AutomaticWorkflowJobLog(models.Model):
+    """Outcome and timings of a step of an automatic workflow run"""
+
+    _name = "automatic.workflow.job.log"
+    _description = "Automatic Workflow Job Log"
+    _order = "date desc, id desc"
+
+    date = fields.Datetime(default=fields.Datetime.now, required=True, index=True)
+    workflow_process_id = fields.Many2one(
+        comodel_name="sale.workflow.process",
+        string="Automatic Workflow",
+        required=True,
+        ondelete="cascade",
+        index=True,
+    )
+    step = fields.Selection(selection=STEP_SELECTION, required=True, index=True)
+    domain = fields.Char(string="Filter Domain")
+    candidate_count = fields.Integer(string="Candidates")
+    done_count = fields.Integer(string="Successes")
+    bypassed_count = fields.Integer(string="Bypasses")
+    failed_count = fields.Integer(string="Failures")
+    duration = fields.Float(string="Wall Time (s)", digits=(16, 3))
+    query_count = fields.Integer(string="SQL Queries")
+    latency_p50 = fields.Float(
+        string="Latency p50 (ms)", digits=(16, 1), group_operator="avg"
+    )
+    latency_p95 = fields.Float(
+        string="Latency p95 (ms)", digits=(16, 1), group_operator="max"
+    )
+
+    @api.model
+    def _log_step(self, sale_workflow, step, domain, stats, duration, query_count):
+        """Store the outcome of a step, steps without candidate are ignored"""
+        if not stats.candidate_count:
+            return self.browse()
+        return self.sudo().create(
+            {
+                "workflow_process_id": sale_workflow.id,
+                "step": step,
+                "domain": str(domain),
+                "candidate_count": stats.candidate_count,
+                "done_count": stats.done_count,
+                "bypassed_count": stats.bypassed_count,
+                "failed_count": stats.failed_count,
+                "duration": duration,
+                "query_count": query_count,
+                "latency_p50": percentile(stats.latencies, 50) * 1000,
+                "latency_p95": percentile(stats.latencies, 95) * 1000,
+            }
+        )
+
+    @api.model
+    def _estimate_duration(self, sale_workflow, step, count, days=30):
+        """Estimate the duration of a step for ``count`` records
+
+        Based on the mean duration per record of the runs of the last days.
+        """
+        if not count:
+            return 0.0
+        limit_date = fields.Datetime.now() - timedelta(days=days)
+        groups = self.sudo().read_group(
+            [
+                ("workflow_process_id", "=", sale_workflow.id),
+                ("step", "=", step),
+                ("date", ">=", limit_date),
+            ],
+            ["duration", "candidate_count"],
+            [],
+        )
+        if not groups or not groups[0]["candidate_count"]:
+            return 0.0
+        return groups[0]["duration"] / groups[0]["candidate_count"] * count
+
+    @api.model
+    def _gc_logs(self):
+        """Remove the logs older than the retention delay, called by a cron"""
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        days = int(get_param("sale_automatic_workflow.log_retention_days", 30))
+        limit_date = fields.Datetime.now() - timedelta(days=days)
+        self.sudo().search([("date", "<", limit_date)]).unlink()
+        return True
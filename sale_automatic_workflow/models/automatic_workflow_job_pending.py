@@ -0,0 +1,80 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+
+class AutomaticWorkflowJobPending(models.Model):
+    """Records waiting to be processed by the incremental automatic workflow
+
+    The records are enqueued when their state changes, the incremental
+    job then only processes the records of the queue.
+    """
+
+    _name = "automatic.workflow.job.pending"
+    _description = "Automatic Workflow Job Pending Record"
+    _log_access = False
+
+    res_model = fields.Char(required=True, index=True)
+    res_id = fields.Integer(required=True)
+    enqueue_date = fields.Datetime(required=True)
+
+    _sql_constraints = [
+        (
+            "record_uniq",
+            "unique(res_model, res_id)",
+            "A record can only be enqueued once.",
+        )
+    ]
+
+    @api.model
+    def _is_enabled(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return bool(get_param("sale_automatic_workflow.incremental"))
+
+    @api.model
+    def _enqueue(self, records):
+        """Add the records having an automatic workflow to the queue
+
+        A record already in the queue has its enqueue date updated, so it
+        is not removed by a job which read the queue before.
+        """
+        if not records or not self._is_enabled():
+            return
+        ids = records.filtered("workflow_process_id").ids
+        if not ids:
+            return
+        self.env.cr.execute(
+            """
+            INSERT INTO automatic_workflow_job_pending
+                (res_model, res_id, enqueue_date)
+            SELECT %s, unnest(%s), clock_timestamp() AT TIME ZONE 'UTC'
+            ON CONFLICT (res_model, res_id)
+            DO UPDATE SET enqueue_date = EXCLUDED.enqueue_date
+            """,
+            (records._name, ids),
+        )
+
+    @api.model
+    def _read_queue(self, model_name):
+        """Return the ids of the enqueued records and the date of the read"""
+        self.env.cr.execute(
+            """
+            SELECT array_agg(res_id), clock_timestamp() AT TIME ZONE 'UTC'
+            FROM automatic_workflow_job_pending
+            WHERE res_model = %s
+            """,
+            (model_name,),
+        )
+        ids, read_date = self.env.cr.fetchone()
+        return ids or [], read_date
+
+    @api.model
+    def _dequeue(self, model_name, read_date):
+        """Remove the records of a model enqueued before ``read_date``"""
+        self.env.cr.execute(
+            """
+            DELETE FROM automatic_workflow_job_pending
+            WHERE res_model = %s AND enqueue_date <= %s
+            """,
+            (model_name, read_date),
+        )
@@ -0,0 +1,34 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+INCREMENTAL_PARAM = "sale_automatic_workflow.incremental"
+
+
+class IrConfigParameter(models.Model):
+    _inherit = "ir.config_parameter"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        params = super().create(vals_list)
+        params._update_automatic_workflow_crons()
+        return params
+
+    def write(self, vals):
+        res = super().write(vals)
+        self._update_automatic_workflow_crons()
+        return res
+
+    def unlink(self):
+        incremental = any(param.key == INCREMENTAL_PARAM for param in self)
+        res = super().unlink()
+        if incremental:
+            self.env["automatic.workflow.job"]._update_crons()
+        return res
+
+    def _update_automatic_workflow_crons(self):
+        """Switch the scheduled actions of the automatic workflow when the
+        incremental mode is enabled or disabled
+        """
+        if any(param.key == INCREMENTAL_PARAM for param in self):
+            self.env["automatic.workflow.job"]._update_crons()
@@ -72,7 +72,19 @@ class SaleOrder(models.Model):
                     line.write({"qty_delivered": line.product_uom_qty})
         return super()._create_invoices(grouped=grouped, final=final)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        orders = super().create(vals_list)
+        self.env["automatic.workflow.job.pending"]._enqueue(orders)
+        return orders
+
     def write(self, vals):
+        res = self._write_keep_order_date(vals)
+        if "state" in vals or "workflow_process_id" in vals:
+            self.env["automatic.workflow.job.pending"]._enqueue(self)
+        return res
+
+    def _write_keep_order_date(self, vals):
         if vals.get("state") == "sale" and vals.get("date_order"):
             sales_keep_order_date = self.filtered(
                 lambda sale: sale.workflow_process_id.invoice_date_is_order_date
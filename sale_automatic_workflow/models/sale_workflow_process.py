@@ -3,7 +3,11 @@
 # Copyright 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import api, fields, models
+from collections import defaultdict
+
+from odoo import _, api, fields, models, tools
+from odoo.tools import float_compare
+from odoo.tools.safe_eval import safe_eval
 
 
 class SaleWorkflowProcess(models.Model):
@@ -19,6 +23,7 @@ class SaleWorkflowProcess(models.Model):
 
     _name = "sale.workflow.process"
     _description = "Sale Workflow Process"
+    _order = "sequence, id"
 
     @api.model
     def _default_filter(self, xmlid):
@@ -28,6 +33,12 @@ class SaleWorkflowProcess(models.Model):
         return self.env["ir.filters"].browse()
 
     name = fields.Char()
+    sequence = fields.Integer(
+        string="Priority",
+        default=10,
+        help="The automatic workflow job processes the workflows with the "
+        "lowest priority value first.",
+    )
     picking_policy = fields.Selection(
         selection=[
             ("direct", "Deliver each product when available"),
@@ -108,6 +119,12 @@ class SaleWorkflowProcess(models.Model):
             "sale_automatic_workflow." "automatic_workflow_validate_invoice_filter"
         ),
     )
+    batch_size = fields.Integer(
+        default=0,
+        help="When set, the automatic actions are applied on batches of this "
+        "size instead of one record at a time. When a batch fails, its "
+        "records are processed again one by one to isolate the failing one.",
+    )
     sale_done_filter_id = fields.Many2one(
         "ir.filters",
         string="Sale Done Filter",
@@ -115,3 +132,123 @@ class SaleWorkflowProcess(models.Model):
             "sale_automatic_workflow.automatic_workflow_sale_done_filter"
         ),
     )
+
+    @api.model
+    @tools.ormcache("filter_id", "write_date")
+    def _eval_filter_domain(self, filter_id, write_date):
+        domain = safe_eval(self.env["ir.filters"].browse(filter_id).domain)
+        return tuple(domain)
+
+    def _get_filter_domain(self, filter_field):
+        """Return the evaluated domain of one of the filters of the workflow
+
+        The evaluation is cached until the filter is modified.
+        """
+        self.ensure_one()
+        ir_filter = self[filter_field]
+        return list(self._eval_filter_domain(ir_filter.id, ir_filter.write_date))
+
+    def _plan_blocked_records(self, step, records):
+        """Return the records of a step which would not be processed
+
+        Sales orders to confirm having exceptions (when the
+        ``sale_exception`` module is installed) and pickings lacking stock
+        are blocked.
+        """
+        if step == "validate_order":
+            return self._plan_orders_with_exceptions(records)
+        if step == "validate_picking":
+            return self._plan_pickings_missing_stock(records)
+        return records.browse()
+
+    @api.model
+    def _plan_orders_with_exceptions(self, sales):
+        """Return the sales orders whose confirmation is blocked by sale
+        exceptions, when the ``sale_exception`` module is installed"""
+        if "exception_ids" not in sales._fields:
+            return sales.browse()
+        return sales.filtered(
+            lambda sale: sale.exception_ids and not sale.ignore_exception
+        )
+
+    @api.model
+    def _plan_pickings_missing_stock(self, pickings):
+        """Return the pickings which cannot be fully reserved
+
+        The demand of all the pickings is compared to the free quantity of
+        their source location, nothing is reserved.
+        """
+        moves = pickings.mapped("move_lines").filtered(
+            lambda m: m.state not in ("done", "cancel")
+            and m.product_id.type == "product"
+        )
+        demand = defaultdict(float)
+        for move in moves:
+            key = (move.location_id, move.product_id)
+            # quantities in the unit of measure of the product
+            reserved_qty = sum(move.move_line_ids.mapped("product_qty"))
+            demand[key] += move.product_qty - reserved_qty
+        missing = set()
+        for location in moves.mapped("location_id"):
+            products = moves.filtered(lambda m: m.location_id == location).mapped(
+                "product_id"
+            )
+            for product in products.with_context(location=location.id):
+                if (
+                    float_compare(
+                        demand[(location, product)],
+                        product.free_qty,
+                        precision_rounding=product.uom_id.rounding,
+                    )
+                    > 0
+                ):
+                    missing.add((location, product))
+        return pickings.filtered(
+            lambda p: any(
+                (move.location_id, move.product_id) in missing
+                for move in p.move_lines & moves
+            )
+        )
+
+    def plan_run(self):
+        """Dry-run of the automatic workflow job for these workflows
+
+        Nothing is modified. Return, for each enabled step, the number of
+        records currently matching its filter, the number of them which
+        would be blocked, and a duration estimated from the past runs.
+        The records which the previous steps would create or modify are
+        not taken into account.
+        """
+        job = self.env["automatic.workflow.job"]
+        log_obj = self.env["automatic.workflow.job.log"]
+        plan = []
+        for workflow in self:
+            for step, model_name, __, domain in job._workflow_steps(workflow):
+                records = self.env[model_name].search(domain)
+                plan.append(
+                    {
+                        "workflow_process_id": workflow.id,
+                        "step": step,
+                        "candidate_count": len(records),
+                        "blocked_count": len(
+                            workflow._plan_blocked_records(step, records)
+                        ),
+                        "estimated_duration": log_obj._estimate_duration(
+                            workflow, step, len(records)
+                        ),
+                    }
+                )
+        return plan
+
+    def action_plan_run(self):
+        plan = self.env["sale.workflow.process.plan"].create(
+            {"line_ids": [(0, 0, values) for values in self.plan_run()]}
+        )
+        return {
+            "name": _("Automatic Workflow Run Plan"),
+            "type": "ir.actions.act_window",
+            "res_model": plan._name,
+            "res_id": plan.id,
+            "view_mode": "form",
+            "target": "new",
+        }
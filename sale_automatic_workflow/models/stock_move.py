@@ -15,3 +15,13 @@ class StockMove(models.Model):
         if sale:
             values["workflow_process_id"] = sale.workflow_process_id.id
         return values
+
+    def write(self, vals):
+        res = super().write(vals)
+        pending = self.env["automatic.workflow.job.pending"]
+        if "state" in vals and pending._is_enabled():
+            # the state of the pickings is computed from the moves
+            pickings = self.mapped("picking_id")
+            pending._enqueue(pickings)
+            pending._enqueue(pickings.mapped("sale_id"))
+        return res
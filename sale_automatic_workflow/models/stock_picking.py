@@ -3,7 +3,9 @@
 # Copyright 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from collections import defaultdict
+
+from odoo import api, fields, models
 from odoo.tools import float_compare
 
 
@@ -14,6 +16,12 @@ class StockPicking(models.Model):
         comodel_name="sale.workflow.process", string="Sale Workflow Process"
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        pickings = super().create(vals_list)
+        self.env["automatic.workflow.job.pending"]._enqueue(pickings)
+        return pickings
+
     def validate_picking(self):
         """Set quantities automatically and validate the pickings."""
         for picking in self:
@@ -34,3 +42,91 @@ class StockPicking(models.Model):
                         move_line.qty_done = move_line.product_uom_qty
             picking.with_context(skip_overprocessed_check=True).button_validate()
         return True
+
+    def _set_quantities_done(self):
+        """Set the done quantities of the moves not fully processed
+
+        The move lines are written once per reserved quantity instead of
+        one by one.
+        """
+        moves = self.mapped("move_lines").filtered(
+            lambda m: m.state not in ["done", "cancel"]
+            and float_compare(
+                m.quantity_done,
+                m.product_qty,
+                precision_rounding=m.product_id.uom_id.rounding,
+            )
+            == -1
+        )
+        move_line_ids_by_qty = defaultdict(list)
+        for move_line in moves.mapped("move_line_ids"):
+            move_line_ids_by_qty[move_line.product_uom_qty].append(move_line.id)
+        move_line_obj = self.env["stock.move.line"]
+        for qty, move_line_ids in move_line_ids_by_qty.items():
+            move_line_obj.browse(move_line_ids).write({"qty_done": qty})
+
+    def _is_fully_done(self):
+        """Return True when all the moves have their quantity done
+
+        Those pickings can be validated without the immediate transfer
+        or backorder wizards.
+        """
+        self.ensure_one()
+        moves = self.move_lines.filtered(lambda m: m.state not in ["done", "cancel"])
+        return bool(moves) and all(
+            float_compare(
+                move.quantity_done,
+                move.product_uom_qty,
+                precision_rounding=move.product_uom.rounding,
+            )
+            >= 0
+            for move in moves
+        )
+
+    def _is_missing_lots(self):
+        """Return True when done move lines of tracked products have no lot
+
+        The same check as ``button_validate``, the picking must go through
+        it to get its error.
+        """
+        self.ensure_one()
+        picking_type = self.picking_type_id
+        if not (picking_type.use_create_lots or picking_type.use_existing_lots):
+            return False
+        return any(
+            line.product_id.tracking != "none" and not line.lot_id and not line.lot_name
+            for line in self.move_line_ids
+            if float_compare(
+                line.qty_done, 0, precision_rounding=line.product_uom_id.rounding
+            )
+        )
+
+    def _can_validate_in_bulk(self):
+        """Return True when the picking can be validated with the others,
+        without ``button_validate``
+
+        The fully done pickings whose tracked products have their lots can.
+        Modules extending ``button_validate`` with checks or actions which
+        must not be skipped extend this method to exclude their pickings.
+        """
+        self.ensure_one()
+        return self._is_fully_done() and not self._is_missing_lots()
+
+    def validate_picking_bulk(self):
+        """Set quantities automatically and validate the pickings together
+
+        The pickings are reserved in a single call, and the ones accepted
+        by ``_can_validate_in_bulk`` are validated together with
+        ``action_done``, skipping the checks of ``button_validate`` which
+        only lead to the wizards for those pickings. The other pickings go
+        through ``button_validate`` one by one, as with ``validate_picking``.
+        """
+        self.action_assign()
+        self._set_quantities_done()
+        pickings = self.filtered(lambda p: p.state not in ["done", "cancel"])
+        ready = pickings.filtered(lambda p: p._can_validate_in_bulk())
+        if ready:
+            ready.with_context(skip_overprocessed_check=True).action_done()
+        for picking in pickings - ready:
+            picking.with_context(skip_overprocessed_check=True).button_validate()
+        return True
@@ -1,2 +1,3 @@
 from . import test_automatic_workflow
+from . import test_benchmark
 from . import test_multicompany
@@ -6,6 +6,7 @@ from datetime import timedelta
 import mock
 
 from odoo import fields
+from odoo.exceptions import UserError
 from odoo.tests import tagged
 
 from .common import TestAutomaticWorkflowMixin, TestCommon
@@ -29,6 +30,391 @@ class TestAutomaticWorkflow(TestCommon, TestAutomaticWorkflowMixin):
         self.run_job()
         self.assertEqual(picking.state, "done")
 
+    def test_full_automatic_batch(self):
+        workflow = self.create_full_automatic(override={"batch_size": 10})
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+        for sale in sales:
+            sale._onchange_workflow_process_id()
+        self.run_job()
+        for sale in sales:
+            self.assertEqual(sale.state, "sale")
+            self.assertEqual(len(sale.invoice_ids), 1)
+            self.assertEqual(sale.invoice_ids.state, "posted")
+            self.assertEqual(sale.picking_ids.state, "done")
+
+    def test_batch_fallback_one_by_one(self):
+        workflow = self.create_full_automatic(override={"batch_size": 10})
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+        job_class = type(self.env["automatic.workflow.job"])
+        with mock.patch.object(
+            job_class,
+            "_do_validate_sale_order_batch",
+            side_effect=UserError("Batch failure"),
+        ) as mocked:
+            self.env["automatic.workflow.job"]._validate_sale_orders(
+                [("id", "in", sales.ids)], batch_size=10
+            )
+            mocked.assert_called_once()
+        self.assertEqual(set(sales.mapped("state")), {"sale"})
+
+    def test_batch_fallback_rollback(self):
+        workflow = self.create_full_automatic(override={"batch_size": 10})
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+
+        def fail_halfway(job, batch):
+            batch[0].note = "Processed in batch"
+            raise UserError("Batch failure")
+
+        job_class = type(self.env["automatic.workflow.job"])
+        with mock.patch.object(
+            job_class,
+            "_do_validate_sale_order_batch",
+            autospec=True,
+            side_effect=fail_halfway,
+        ):
+            self.env["automatic.workflow.job"]._validate_sale_orders(
+                [("id", "in", sales.ids)], batch_size=10
+            )
+        self.assertEqual(set(sales.mapped("state")), {"sale"})
+        # the write of the failed batch is rolled back
+        self.assertNotEqual(sales[0].note, "Processed in batch")
+
+    def test_batch_partially_processed(self):
+        workflow = self.create_full_automatic(override={"batch_size": 10})
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+
+        def confirm_first(job, batch):
+            # like the confirmation of orders having sale exceptions,
+            # returning a popup instead of raising
+            batch[0].action_confirm()
+
+        job_class = type(self.env["automatic.workflow.job"])
+        with mock.patch.object(
+            job_class,
+            "_do_validate_sale_order_batch",
+            autospec=True,
+            side_effect=confirm_first,
+        ) as mocked:
+            stats = self.env["automatic.workflow.job"]._validate_sale_orders(
+                [("id", "in", sales.ids), ("state", "=", "draft")], batch_size=10
+            )
+            mocked.assert_called_once()
+        self.assertEqual(set(sales.mapped("state")), {"sale"})
+        self.assertEqual(stats.done_count, 2)
+        self.assertEqual(len(stats.latencies), 2)
+
+    def test_workflow_steps(self):
+        workflow = self.create_full_automatic(override={"sale_done": True})
+        job = self.env["automatic.workflow.job"]
+        steps = job._workflow_steps(workflow)
+        self.assertEqual(
+            [step[0] for step in steps],
+            [
+                "validate_order",
+                "validate_picking",
+                "create_invoice",
+                "validate_invoice",
+                "sale_done",
+            ],
+        )
+        for __, model_name, method_name, domain in steps:
+            self.assertIn(("workflow_process_id", "=", workflow.id), domain)
+            self.assertTrue(hasattr(job, method_name))
+
+    def test_claim_records(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        job = self.env["automatic.workflow.job"]
+        self.assertEqual(job._claim_records("sale.order", sale.ids), sale.ids)
+        # workers open their own cursor, they are not used during tests
+        self.assertEqual(job._get_worker_count(), 1)
+
+    def test_job_log(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        sale._onchange_workflow_process_id()
+        self.run_job()
+        logs = self.env["automatic.workflow.job.log"].search(
+            [("workflow_process_id", "=", workflow.id)]
+        )
+        log = logs.filtered(lambda log: log.step == "validate_order")
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log.candidate_count, 1)
+        self.assertEqual(log.done_count, 1)
+        self.assertEqual(log.failed_count, 0)
+        self.assertGreater(log.query_count, 0)
+        self.assertGreaterEqual(log.latency_p95, log.latency_p50)
+        self.assertIn("create_invoice", logs.mapped("step"))
+        # nothing left to process: steps without candidates are not logged
+        self.run_job()
+        self.assertEqual(
+            self.env["automatic.workflow.job.log"].search_count(
+                [("workflow_process_id", "=", workflow.id)]
+            ),
+            len(logs),
+        )
+
+    def test_job_log_failure(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        mock_path = "odoo.addons.sale.models.sale.SaleOrder.action_confirm"
+        with mock.patch(mock_path, side_effect=UserError("Failure")):
+            stats = self.env["automatic.workflow.job"]._validate_sale_orders(
+                [("id", "=", sale.id)]
+            )
+        self.assertEqual(stats.candidate_count, 1)
+        self.assertEqual(stats.failed_count, 1)
+        self.assertEqual(stats.done_count, 0)
+
+    def test_filter_domain_cache(self):
+        workflow = self.create_full_automatic()
+        order_filter = self.env["ir.filters"].create(
+            {
+                "name": "Draft orders",
+                "model_id": "sale.order",
+                "domain": "[('state', '=', 'draft')]",
+            }
+        )
+        workflow.order_filter_id = order_filter
+        self.assertEqual(
+            workflow._get_filter_domain("order_filter_id"), [("state", "=", "draft")]
+        )
+        order_filter.domain = "[('state', '=', 'sent')]"
+        self.assertEqual(
+            workflow._get_filter_domain("order_filter_id"), [("state", "=", "sent")]
+        )
+
+    def test_step_chunks_domain(self):
+        workflow = self.create_full_automatic(override={"batch_size": 10})
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+        job = self.env["automatic.workflow.job"]
+        domain = [("state", "=", "draft"), ("workflow_process_id", "=", workflow.id)]
+        job_class = type(job)
+        with mock.patch.object(
+            job_class,
+            "_get_domain_query",
+            autospec=True,
+            side_effect=job_class._get_domain_query,
+        ) as mocked:
+            for sale in sales:
+                job._run_step(
+                    workflow,
+                    "validate_order",
+                    "_validate_sale_orders",
+                    domain,
+                    [sale.id],
+                )
+        self.assertEqual(set(sales.mapped("state")), {"sale"})
+        # the chunks are filtered with the same domain, without their ids
+        for call in mocked.call_args_list:
+            self.assertEqual(call[0][1:], ("sale.order", domain))
+
+    def test_batch_filter(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        job = self.env["automatic.workflow.job"]
+        self.assertEqual(job._batch_filter(sale, [("state", "=", "draft")]), sale)
+        sale.action_confirm()
+        self.assertFalse(job._batch_filter(sale, [("state", "=", "draft")]))
+
+    def test_batch_filter_relational_domain(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        job = self.env["automatic.workflow.job"]
+        domain = [("partner_id.name", "=", "Renamed customer")]
+        self.assertFalse(job._batch_filter(sale, domain))
+        # the ids of the subdomain are not kept from a compilation to another
+        sale.partner_id.name = "Renamed customer"
+        self.assertEqual(job._batch_filter(sale, domain), sale)
+
+    def test_incremental(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_automatic_workflow.incremental", "1"
+        )
+        pending = self.env["automatic.workflow.job.pending"]
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        sale._onchange_workflow_process_id()
+        self.assertIn(sale.id, pending._read_queue("sale.order")[0])
+        self.env["automatic.workflow.job"].run_incremental()
+        self.assertEqual(sale.state, "sale")
+        self.assertEqual(sale.invoice_ids.state, "posted")
+        self.assertEqual(sale.picking_ids.state, "done")
+        self.assertNotIn(sale.id, pending._read_queue("sale.order")[0])
+
+    def test_incremental_enqueued_between_steps(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_automatic_workflow.incremental", "1"
+        )
+        pending = self.env["automatic.workflow.job.pending"]
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        sale._onchange_workflow_process_id()
+        new_sales = self.env["sale.order"]
+        job_class = type(self.env["automatic.workflow.job"])
+        run_step_chunks = job_class._run_step_chunks
+
+        def enqueue_after_confirm(job, sale_workflow, step, *args):
+            nonlocal new_sales
+            res = run_step_chunks(job, sale_workflow, step, *args)
+            if step == "validate_order" and not new_sales:
+                new_sales = self.create_sale_order(workflow)
+                new_sales._onchange_workflow_process_id()
+            return res
+
+        with mock.patch.object(
+            job_class,
+            "_run_step_chunks",
+            autospec=True,
+            side_effect=enqueue_after_confirm,
+        ):
+            self.env["automatic.workflow.job"].run_incremental()
+        self.assertEqual(sale.state, "sale")
+        self.assertNotIn(sale.id, pending._read_queue("sale.order")[0])
+        # the order enqueued after the confirmation step stays in the queue
+        self.assertEqual(new_sales.state, "draft")
+        self.assertIn(new_sales.id, pending._read_queue("sale.order")[0])
+        self.env["automatic.workflow.job"].run_incremental()
+        self.assertEqual(new_sales.state, "sale")
+
+    def test_incremental_crons(self):
+        full_cron = self.env.ref(
+            "sale_automatic_workflow.ir_cron_automatic_workflow_job"
+        )
+        incremental_cron = self.env.ref(
+            "sale_automatic_workflow.ir_cron_automatic_workflow_job_incremental"
+        )
+        config = self.env["ir.config_parameter"].sudo()
+        config.set_param("sale_automatic_workflow.incremental", "1")
+        self.assertTrue(incremental_cron.active)
+        self.assertEqual(full_cron.interval_type, "hours")
+        config.set_param("sale_automatic_workflow.incremental", False)
+        self.assertFalse(incremental_cron.active)
+        self.assertEqual(full_cron.interval_type, "minutes")
+
+    def test_incremental_disabled(self):
+        pending = self.env["automatic.workflow.job.pending"]
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        self.assertNotIn(sale.id, pending._read_queue("sale.order")[0])
+        # records not enqueued are not processed by the incremental job
+        self.env["automatic.workflow.job"].run_incremental()
+        self.assertEqual(sale.state, "draft")
+
+    def test_validate_picking_bulk(self):
+        workflow = self.create_full_automatic()
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+        sales.action_confirm()
+        pickings = sales.mapped("picking_ids")
+        self.assertEqual(len(pickings), 2)
+        pickings.validate_picking_bulk()
+        self.assertEqual(set(pickings.mapped("state")), {"done"})
+        for move in pickings.mapped("move_lines"):
+            self.assertEqual(move.quantity_done, move.product_uom_qty)
+
+    def test_validate_picking_bulk_extended(self):
+        workflow = self.create_full_automatic()
+        sales = self.create_sale_order(workflow) | self.create_sale_order(workflow)
+        sales.action_confirm()
+        pickings = sales.mapped("picking_ids")
+        picking_class = type(self.env["stock.picking"])
+        with mock.patch.object(
+            picking_class, "_can_validate_in_bulk", return_value=False
+        ), mock.patch.object(
+            picking_class,
+            "button_validate",
+            autospec=True,
+            side_effect=picking_class.button_validate,
+        ) as mocked:
+            pickings.validate_picking_bulk()
+        # the checks of the extensions of button_validate are not skipped
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(set(pickings.mapped("state")), {"done"})
+
+    def test_validate_picking_bulk_lots(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        sale.action_confirm()
+        picking = sale.picking_ids
+        picking.action_assign()
+        picking._set_quantities_done()
+        self.assertTrue(picking._can_validate_in_bulk())
+        # a tracked product without lot goes through button_validate
+        picking.move_lines.mapped("product_id").tracking = "lot"
+        self.assertFalse(picking._can_validate_in_bulk())
+
+    def test_plan_run(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        plan = {values["step"]: values for values in workflow.plan_run()}
+        self.assertEqual(plan["validate_order"]["candidate_count"], 1)
+        self.assertEqual(plan["validate_order"]["blocked_count"], 0)
+        self.assertEqual(plan["validate_order"]["estimated_duration"], 0.0)
+        self.assertEqual(plan["create_invoice"]["candidate_count"], 0)
+        self.assertEqual(sale.state, "draft")
+        # the estimation is based on the past runs
+        self.run_job()
+        self.create_sale_order(workflow)
+        plan = {values["step"]: values for values in workflow.plan_run()}
+        self.assertGreater(plan["validate_order"]["estimated_duration"], 0.0)
+        action = workflow.action_plan_run()
+        wizard = self.env[action["res_model"]].browse(action["res_id"])
+        self.assertEqual(len(wizard.line_ids), len(plan))
+
+    def test_plan_run_missing_stock(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        sale.order_line.product_uom_qty = 10
+        sale.action_confirm()
+        plan = {values["step"]: values for values in workflow.plan_run()}
+        self.assertEqual(plan["validate_picking"]["candidate_count"], 1)
+        self.assertEqual(plan["validate_picking"]["blocked_count"], 1)
+
+    def test_plan_run_exceptions(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        sale_to_invoice = self.create_sale_order(workflow)
+        sale_to_invoice.order_line.product_id.invoice_policy = "order"
+        sale_to_invoice.action_confirm()
+        workflow_class = type(workflow)
+        with mock.patch.object(
+            workflow_class,
+            "_plan_orders_with_exceptions",
+            autospec=True,
+            side_effect=lambda self, sales: sales,
+        ):
+            plan = {values["step"]: values for values in workflow.plan_run()}
+        self.assertEqual(plan["validate_order"]["candidate_count"], 1)
+        self.assertEqual(plan["validate_order"]["blocked_count"], 1)
+        # the exceptions only block the confirmation of the orders
+        self.assertEqual(plan["create_invoice"]["candidate_count"], 1)
+        self.assertEqual(plan["create_invoice"]["blocked_count"], 0)
+        self.assertEqual(sale.state, "draft")
+
+    def test_time_budget(self):
+        workflow = self.create_full_automatic()
+        sale = self.create_sale_order(workflow)
+        job = self.env["automatic.workflow.job"]
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_automatic_workflow.time_budget", "60"
+        )
+        self.assertFalse(job._with_time_budget()._is_budget_exhausted())
+        # budget already exhausted: nothing is processed
+        exhausted_job = job.with_context(automatic_workflow_deadline=1)
+        self.assertFalse(exhausted_job._run_with_budget(workflow))
+        self.assertEqual(sale.state, "draft")
+        self.run_job()
+        self.assertEqual(sale.state, "sale")
+        self.assertEqual(sale.invoice_ids.state, "posted")
+
+    def test_workflow_priority(self):
+        workflow = self.create_full_automatic()
+        workflow_first = self.create_full_automatic(override={"sequence": 1})
+        workflows = self.env["sale.workflow.process"].search(
+            [("id", "in", (workflow | workflow_first).ids)]
+        )
+        self.assertEqual(workflows[0], workflow_first)
+
     def test_onchange(self):
         workflow = self.create_full_automatic()
         sale = self.create_sale_order(workflow)
@@ -0,0 +1,89 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import time
+
+from odoo.tests import tagged
+
+from .common import TestCommon
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("post_install", "-at_install", "-standard", "automatic_workflow_benchmark")
+class TestBenchmarkPicking(TestCommon):
+    """Compare the throughput of the picking validation paths
+
+    Not part of the standard tests, run it with
+    ``--test-tags automatic_workflow_benchmark``.
+    """
+
+    picking_count = 1000
+    line_count = 10
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stock_location = cls.env.ref("stock.stock_location_stock")
+        cls.customer_location = cls.env.ref("stock.stock_location_customers")
+        cls.picking_type = cls.env.ref("stock.picking_type_out")
+        cls.products = cls.env["product.product"].create(
+            [
+                {"name": "Benchmark product %s" % index, "type": "product"}
+                for index in range(cls.line_count)
+            ]
+        )
+        for product in cls.products:
+            cls.env["stock.quant"]._update_available_quantity(
+                product, cls.stock_location, 2 * cls.picking_count
+            )
+
+    def _create_pickings(self, count):
+        pickings = self.env["stock.picking"].create(
+            [
+                {
+                    "picking_type_id": self.picking_type.id,
+                    "location_id": self.stock_location.id,
+                    "location_dest_id": self.customer_location.id,
+                    "move_lines": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": product.name,
+                                "product_id": product.id,
+                                "product_uom": product.uom_id.id,
+                                "product_uom_qty": 1,
+                                "location_id": self.stock_location.id,
+                                "location_dest_id": self.customer_location.id,
+                            },
+                        )
+                        for product in self.products
+                    ],
+                }
+                for __ in range(count)
+            ]
+        )
+        pickings.action_confirm()
+        return pickings
+
+    def _benchmark(self, method_name):
+        pickings = self._create_pickings(self.picking_count)
+        start = time.perf_counter()
+        getattr(pickings, method_name)()
+        duration = time.perf_counter() - start
+        self.assertEqual(set(pickings.mapped("state")), {"done"})
+        _logger.info(
+            "%s: %s pickings x %s lines in %.2fs (%.1f pickings/s)",
+            method_name,
+            self.picking_count,
+            self.line_count,
+            duration,
+            self.picking_count / duration,
+        )
+        return duration
+
+    def test_benchmark_validate_picking(self):
+        one_by_one = self._benchmark("validate_picking")
+        bulk = self._benchmark("validate_picking_bulk")
+        _logger.info("validate_picking_bulk speedup: x%.1f", one_by_one / bulk)
@@ -1,6 +1,8 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import mock
+
 from odoo.tests import tagged
 
 from .common import TestCommon
@@ -177,3 +179,32 @@ class TestMultiCompany(TestCommon):
         self.assertEquals(
             invoice_fr_daughter.journal_id.company_id, order_fr_daughter.company_id
         )
+
+    def test_company_context(self):
+        self.env.user.company_id = self.env.ref("base.main_company")
+        order_fr = self.create_auto_wkf_order(
+            self.company_fr, self.customer_fr, self.product_fr, 5
+        )
+        order_ch = self.create_auto_wkf_order(
+            self.company_ch, self.customer_ch, self.product_ch, 10
+        )
+        job_class = type(self.env["automatic.workflow.job"])
+        companies = []
+
+        def validate_sale_order(job, sale, domain_filter):
+            companies.append((sale.company_id, job.env.company))
+
+        users_write = type(self.env["res.users"]).write
+        with mock.patch.object(
+            job_class, "_do_validate_sale_order", validate_sale_order
+        ), mock.patch.object(
+            type(self.env["res.users"]), "write", autospec=True, wraps=users_write
+        ) as mocked_write:
+            self.env["automatic.workflow.job"]._validate_sale_orders(
+                [("id", "in", (order_fr | order_ch).ids)]
+            )
+            mocked_write.assert_not_called()
+        self.assertEqual(len(companies), 2)
+        for order_company, current_company in companies:
+            self.assertEqual(order_company, current_company)
+        self.assertEqual(self.env.user.company_id, self.env.ref("base.main_company"))
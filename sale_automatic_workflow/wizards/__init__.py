@@ -0,0 +1 @@
+from . import sale_workflow_process_plan
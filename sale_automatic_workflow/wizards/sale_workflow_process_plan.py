@@ -0,0 +1,51 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+from ..models.automatic_workflow_job_log import STEP_SELECTION
+
+
+class SaleWorkflowProcessPlan(models.TransientModel):
+    """Dry-run of the automatic workflow job"""
+
+    _name = "sale.workflow.process.plan"
+    _description = "Automatic Workflow Run Plan"
+
+    line_ids = fields.One2many(
+        comodel_name="sale.workflow.process.plan.line",
+        inverse_name="plan_id",
+        readonly=True,
+    )
+    estimated_duration = fields.Float(
+        string="Estimated Duration (s)",
+        compute="_compute_estimated_duration",
+        digits=(16, 1),
+    )
+
+    @api.depends("line_ids.estimated_duration")
+    def _compute_estimated_duration(self):
+        for plan in self:
+            plan.estimated_duration = sum(plan.line_ids.mapped("estimated_duration"))
+
+
+class SaleWorkflowProcessPlanLine(models.TransientModel):
+    _name = "sale.workflow.process.plan.line"
+    _description = "Automatic Workflow Run Plan Line"
+
+    plan_id = fields.Many2one(
+        comodel_name="sale.workflow.process.plan", required=True, ondelete="cascade"
+    )
+    workflow_process_id = fields.Many2one(
+        comodel_name="sale.workflow.process", string="Automatic Workflow"
+    )
+    step = fields.Selection(selection=STEP_SELECTION)
+    candidate_count = fields.Integer(string="Records to Process")
+    blocked_count = fields.Integer(
+        string="Blocked Records",
+        help="Records which would fail, because of exceptions or missing stock",
+    )
+    estimated_duration = fields.Float(
+        string="Estimated Duration (s)",
+        digits=(16, 1),
+        help="Estimated from the runs of the last days, 0 without any run",
+    )
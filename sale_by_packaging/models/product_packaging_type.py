@@ -12,6 +12,13 @@ class ProductPackagingType(models.Model):
         comodel_name="product.packaging", inverse_name="packaging_type_id"
     )
 
+    def write(self, vals):
+        res = super().write(vals)
+        if "can_be_sold" in vals:
+            # Invalidate ProductProduct._get_sellable_packaging_quantities
+            self.clear_caches()
+        return res
+
     @api.constrains("can_be_sold")
     def _check_sell_only_by_packaging_can_be_sold_packaging_ids(self):
         for record in self:
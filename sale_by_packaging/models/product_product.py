@@ -1,7 +1,7 @@
 # Copyright 2020 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from odoo import models, tools
 from odoo.tools import float_compare, float_is_zero, float_round
 
 
@@ -37,21 +37,40 @@ class ProductProduct(models.Model):
                 qty = qty - (qty % q) + q
         return qty
 
+    @tools.ormcache("self.id", "tuple(self.env.companies.ids)")
+    def _get_sellable_packaging_quantities(self):
+        """Return the ``(qty, packaging id)`` of the packagings of the
+        product that can be sold, largest quantity first.
+
+        Cached until a packaging or a packaging type is modified.
+        """
+        self.ensure_one()
+        packagings = self.packaging_ids.filtered(
+            lambda pack: pack.can_be_sold
+            and not float_is_zero(
+                pack.qty, precision_rounding=pack.product_uom_id.rounding
+            )
+        )
+        return tuple(
+            (pack.qty, pack.id)
+            for pack in sorted(packagings, key=lambda pack: pack.qty, reverse=True)
+        )
+
     def get_first_packaging_with_multiple_qty(self, qty):
         """ Return multiple of product packaging for one quantity if exist.
         """
         self.ensure_one()
-        packagings = self._get_packagings_with_multiple_qty(qty)
-        return fields.first(packagings.sorted("qty", reverse=True))
+        rounding = self.uom_id.rounding
+        for pack_qty, pack_id in self._get_sellable_packaging_quantities():
+            if float_is_zero(qty % pack_qty, precision_rounding=rounding):
+                return self.env["product.packaging"].browse(pack_id)
+        return self.env["product.packaging"]
 
     def _get_packagings_with_multiple_qty(self, qty):
         self.ensure_one()
-        return self.packaging_ids.filtered(
-            lambda pack: pack.can_be_sold
-            and not float_is_zero(
-                pack.qty, precision_rounding=pack.product_uom_id.rounding
-            )
-            and float_is_zero(
-                qty % pack.qty, precision_rounding=pack.product_uom_id.rounding
-            )
+        rounding = self.uom_id.rounding
+        return self.env["product.packaging"].browse(
+            pack_id
+            for pack_qty, pack_id in self._get_sellable_packaging_quantities()
+            if float_is_zero(qty % pack_qty, precision_rounding=rounding)
         )
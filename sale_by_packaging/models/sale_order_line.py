@@ -1,5 +1,7 @@
 # Copyright 2020 Camptocamp SA
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl)
+from collections import defaultdict
+
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
 from odoo.tools import float_compare, float_is_zero
@@ -133,10 +135,16 @@ class SaleOrderLine(models.Model):
             fname in vals for fname in fields_to_check
         ):
             return super().write(vals)
+        # Write at once the lines getting the same packaging
+        lines_by_packaging = defaultdict(lambda: self.browse())
         for line in self:
+            packaging_vals = line._write_auto_assign_packaging(vals)
+            lines_by_packaging[packaging_vals.get("product_packaging")] |= line
+        for packaging_id, lines in lines_by_packaging.items():
             line_vals = vals.copy()
-            line_vals.update(line._write_auto_assign_packaging(line_vals))
-            super(SaleOrderLine, line).write(line_vals)
+            if packaging_id:
+                line_vals["product_packaging"] = packaging_id
+            super(SaleOrderLine, lines).write(line_vals)
         return True
 
     def _write_auto_assign_packaging(self, vals):
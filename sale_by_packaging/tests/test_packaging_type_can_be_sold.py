@@ -54,3 +54,28 @@ class TestPackagingTypeCanBeSold(SavepointCase):
             order_line.write({"product_packaging": self.packaging_cannot_be_sold.id})
             onchange_res = order_line._onchange_product_packaging()
             self.assertIn("warning", onchange_res)
+
+    def test_first_packaging_with_multiple_qty(self):
+        product = self.product
+        self.assertEqual(
+            product.get_first_packaging_with_multiple_qty(20.0),
+            self.packaging_can_be_sold,
+        )
+        self.assertFalse(product.get_first_packaging_with_multiple_qty(3.0))
+        # The sellable packagings are cached until one of them changes
+        self.packaging_type_cannot_be_sold.can_be_sold = True
+        self.assertEqual(
+            product.get_first_packaging_with_multiple_qty(20.0),
+            self.packaging_cannot_be_sold,
+        )
+        self.assertEqual(
+            product._get_packagings_with_multiple_qty(20.0),
+            self.packaging_cannot_be_sold | self.packaging_can_be_sold,
+        )
+        self.packaging_cannot_be_sold.qty = 3.0
+        self.assertEqual(
+            product.get_first_packaging_with_multiple_qty(3.0),
+            self.packaging_cannot_be_sold,
+        )
+        self.packaging_cannot_be_sold.unlink()
+        self.assertFalse(product.get_first_packaging_with_multiple_qty(3.0))
@@ -249,3 +249,33 @@ class TestSaleProductByPackagingOnly(SavepointCase):
             line_form.product_uom_qty = 3
             self.assertFalse(line_form.product_packaging)
             self.assertFalse(line_form.product_packaging_qty)
+
+    def test_write_auto_fill_packaging_multi(self):
+        product_2 = self.env["product.product"].create({"name": "Test product 2"})
+        packaging_2 = self.env["product.packaging"].create(
+            {"name": "Test packaging 2", "product_id": product_2.id, "qty": 4.0}
+        )
+        (self.product | product_2).write({"sell_only_by_packaging": True})
+        order_lines = self.env["sale.order.line"].create(
+            [
+                {
+                    "order_id": self.order.id,
+                    "product_id": product.id,
+                    "product_uom": product.uom_id.id,
+                    "product_uom_qty": packaging.qty,
+                }
+                for product, packaging in [
+                    (self.product, self.packaging),
+                    (self.product, self.packaging),
+                    (product_2, packaging_2),
+                ]
+            ]
+        )
+        order_lines.write({"product_uom_qty": 20.0})
+        self.assertEqual(
+            order_lines.mapped("product_packaging"), self.packaging | packaging_2
+        )
+        self.assertEqual(order_lines[0].product_packaging, self.packaging)
+        self.assertEqual(order_lines[1].product_packaging_qty, 4)
+        self.assertEqual(order_lines[2].product_packaging, packaging_2)
+        self.assertEqual(order_lines[2].product_packaging_qty, 5)
@@ -3,7 +3,27 @@
 # Copyright 2019 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import api, fields, models
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import odoo
+from odoo import api, fields, models, tools
+from odoo.exceptions import ValidationError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+# Seconds between two writes of the profiles of the rules
+PROFILE_FLUSH_INTERVAL = 60
+# Profiles of the rules not written yet, by database and rule id:
+# [evaluated records, time, queries]
+_pending_profiles = {}
+_pending_profiles_lock = threading.Lock()
+_profiles_flushed_at = {}
 
 
 class ExceptionRule(models.Model):
@@ -16,6 +36,189 @@ class ExceptionRule(models.Model):
         ]
     )
     sale_ids = fields.Many2many("sale.order", string="Sales")
+    trigger_field_ids = fields.Many2many(
+        comodel_name="ir.model.fields",
+        string="Depends on",
+        domain=[("model", "in", ("sale.order", "sale.order.line"))],
+        help="Fields of the sales order or of its lines the rule depends on. "
+        "When a confirmed order is modified, the rule is only checked again "
+        "if one of them is modified, and only on the modified lines for a "
+        "rule on sales order lines. A rule on sales orders is always checked "
+        "again when lines are modified, as the fields of the order computed "
+        "from its lines change with them. Without any field, the rule is "
+        "always checked again on the whole order.",
+    )
+
+    profile_count = fields.Integer(
+        string="Evaluations",
+        readonly=True,
+        help="Number of records the rule has been evaluated on while the "
+        "profiling of the rules was enabled.",
+    )
+    profile_time = fields.Float(
+        string="Time (s)",
+        readonly=True,
+        help="Cumulative time spent evaluating the rule while the profiling "
+        "of the rules was enabled.",
+    )
+    profile_query_count = fields.Integer(
+        string="Queries",
+        readonly=True,
+        help="Number of SQL queries executed while evaluating the rule "
+        "while the profiling of the rules was enabled.",
+    )
+
+    @api.model
+    def _is_profiling(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return bool(get_param("sale_exception.profile_rules"))
+
+    @contextmanager
+    def _profile(self, records):
+        """Add the evaluation of the rule on records to its profile
+
+        Does nothing unless the profiling of the rules is enabled.
+        """
+        self.ensure_one()
+        if not self._is_profiling():
+            yield
+            return
+        cr = self.env.cr
+        start = time.perf_counter()
+        query_count = cr.sql_log_count
+        yield
+        profile = (
+            len(records),
+            time.perf_counter() - start,
+            cr.sql_log_count - query_count,
+        )
+        with _pending_profiles_lock:
+            pending = _pending_profiles.setdefault(cr.dbname, {})
+            counters = pending.setdefault(self.id, [0, 0.0, 0])
+            for index, value in enumerate(profile):
+                counters[index] += value
+            flushed_at = _profiles_flushed_at.setdefault(cr.dbname, time.time())
+        if time.time() - flushed_at >= PROFILE_FLUSH_INTERVAL:
+            self._flush_profiles()
+
+    @api.model
+    def _flush_profiles(self):
+        """Add the pending profiles to the counters of the rules
+
+        The profiles are accumulated in memory and written at most every
+        ``PROFILE_FLUSH_INTERVAL`` seconds, in a separate transaction, so
+        that the rules are not locked until the end of the detections.
+        The rules locked by another transaction are skipped and kept
+        pending for the next write.
+        """
+        dbname = self.env.cr.dbname
+        with _pending_profiles_lock:
+            pending = _pending_profiles.pop(dbname, {})
+            _profiles_flushed_at[dbname] = time.time()
+        if not pending:
+            return
+        rule_ids = list(pending)
+        counters = [pending[rule_id] for rule_id in rule_ids]
+        with self.pool.cursor() as cr:
+            # The counters are incremented in SQL, on the current values,
+            # without updating the rules
+            cr.execute(
+                """
+                UPDATE exception_rule rule
+                SET profile_count = COALESCE(rule.profile_count, 0) + p.count,
+                    profile_time = COALESCE(rule.profile_time, 0) + p.time,
+                    profile_query_count =
+                        COALESCE(rule.profile_query_count, 0) + p.query_count
+                FROM unnest(%s::int[], %s::int[], %s::float[], %s::int[])
+                    AS p (id, count, time, query_count)
+                WHERE rule.id = p.id AND rule.id IN (
+                    SELECT id FROM exception_rule WHERE id = ANY(%s)
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING rule.id
+                """,
+                (
+                    rule_ids,
+                    [count for count, __, __ in counters],
+                    [duration for __, duration, __ in counters],
+                    [query_count for __, __, query_count in counters],
+                    rule_ids,
+                ),
+            )
+            flushed_ids = {row[0] for row in cr.fetchall()}
+        with _pending_profiles_lock:
+            pending_again = _pending_profiles.setdefault(dbname, {})
+            for rule_id in set(rule_ids) - flushed_ids:
+                counters = pending_again.setdefault(rule_id, [0, 0.0, 0])
+                for index, value in enumerate(pending[rule_id]):
+                    counters[index] += value
+        self.invalidate_cache(
+            ["profile_count", "profile_time", "profile_query_count"], rule_ids
+        )
+
+    def action_reset_profile(self):
+        with _pending_profiles_lock:
+            pending = _pending_profiles.get(self.env.cr.dbname, {})
+            for rule_id in self.ids:
+                pending.pop(rule_id, None)
+        self.write({"profile_count": 0, "profile_time": 0, "profile_query_count": 0})
+
+    def _is_triggered(self, changed_fields):
+        """Return True if the rule depends on one of the changed fields
+
+        ``changed_fields`` is a set of (model name, field name).
+        """
+        self.ensure_one()
+        return bool(
+            {(field.model, field.name) for field in self.trigger_field_ids}
+            & changed_fields
+        )
+
+    # fields of the rules changing the result of a detection
+    _rule_set_fields = (
+        "model",
+        "exception_type",
+        "domain",
+        "code",
+        "method",
+        "active",
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if set(vals) & set(self._rule_set_fields):
+            self.clear_caches()
+        return super().write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super().unlink()
+
+    @api.model
+    def _get_rule_set_version(self, models):
+        """Return a hash of the definition of the active rules of models
+
+        The rules are written on every detection (their reverse many2many
+        field), so their write date cannot be used. The hash is cached
+        until a rule is created, deleted or its definition is modified.
+        """
+        return self._compute_rule_set_version(tuple(models))
+
+    @api.model
+    @tools.ormcache("models")
+    def _compute_rule_set_version(self, models):
+        fnames = [
+            fname
+            for fname in ("model", "exception_type", "domain", "code", "method")
+            if fname in self._fields
+        ]
+        rules = self.sudo().search([("model", "in", models)], order="id")
+        data = rules.read(fnames)
+        return hashlib.md5(repr(data).encode()).hexdigest()
 
 
 class SaleOrder(models.Model):
@@ -27,16 +230,215 @@ class SaleOrder(models.Model):
     def _reverse_field(self):
         return "sale_ids"
 
+    exception_fingerprint = fields.Char(copy=False, readonly=True)
+
     def detect_exceptions(self):
-        all_exceptions = super(SaleOrder, self).detect_exceptions()
-        lines = self.mapped("order_line")
+        """Detect the exceptions, except on orders unchanged since the last
+        detection, whose stored exceptions are returned
+        """
+        rule_set_version = self.env["exception.rule"]._get_rule_set_version(
+            ("sale.order", "sale.order.line")
+        )
+        fingerprints = self._get_exception_fingerprints(rule_set_version)
+        unchanged = self.filtered(
+            lambda order: order.exception_fingerprint
+            and order.exception_fingerprint == fingerprints[order.id]
+        )
+        orders = self - unchanged
+        all_exceptions = unchanged.mapped("exception_ids").ids
+        if not orders:
+            return all_exceptions
+        all_exceptions += super(SaleOrder, orders).detect_exceptions()
+        lines = orders.mapped("order_line")
         all_exceptions += lines.detect_exceptions()
+        orders._store_exception_fingerprints(rule_set_version)
         return all_exceptions
 
+    def _get_exception_fingerprints(self, rule_set_version):
+        """Return the fingerprint of the orders by id
+
+        The fingerprint changes when the order, one of its lines or an
+        exception rule is modified. Changes on other records used by the
+        rules, like the customer, are not taken into account.
+        """
+        if not self:
+            return {}
+        self.flush()
+        self.env.cr.execute(
+            """
+            SELECT so.id, so.write_date, so.ignore_exception,
+                   array_agg(sol.id || ':' || sol.write_date ORDER BY sol.id)
+            FROM sale_order so
+            LEFT JOIN sale_order_line sol ON sol.order_id = so.id
+            WHERE so.id IN %s
+            GROUP BY so.id
+            """,
+            (tuple(self.ids),),
+        )
+        return {
+            row[0]: hashlib.md5(
+                repr(row[1:] + (rule_set_version,)).encode()
+            ).hexdigest()
+            for row in self.env.cr.fetchall()
+        }
+
+    def _store_exception_fingerprints(self, rule_set_version):
+        """Store the fingerprints of the orders after a detection
+
+        They are written in SQL so that the write date of the orders is
+        not updated.
+        """
+        fingerprints = self._get_exception_fingerprints(rule_set_version)
+        if not fingerprints:
+            return
+        self.env.cr.execute(
+            """
+            UPDATE sale_order so SET exception_fingerprint = fp.fingerprint
+            FROM unnest(%s::int[], %s::varchar[]) AS fp (id, fingerprint)
+            WHERE so.id = fp.id
+            """,
+            (list(fingerprints), list(fingerprints.values())),
+        )
+        self.invalidate_cache(["exception_fingerprint"], list(fingerprints))
+
+    def _reset_exception_fingerprints(self):
+        """Reset the fingerprints of modified orders
+
+        They are reset in SQL, like they are stored, so that the orders
+        are not written again.
+        """
+        orders = self.filtered("exception_fingerprint")
+        if not orders:
+            return
+        self.env.cr.execute(
+            "UPDATE sale_order SET exception_fingerprint = NULL WHERE id IN %s",
+            (tuple(orders.ids),),
+        )
+        self.invalidate_cache(["exception_fingerprint"], orders.ids)
+
+    def _detect_exceptions(self, rule):
+        with rule._profile(self):
+            return super()._detect_exceptions(rule)
+
+    @api.model
+    def _get_draft_orders_batch_size(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("sale_exception.draft_orders_batch_size", 500))
+
+    @api.model
+    def _get_draft_orders_worker_count(self):
+        """Number of workers checking the draft orders, 1 runs serially"""
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        worker_count = int(get_param("sale_exception.draft_orders_worker_count", 1))
+        if getattr(threading.currentThread(), "testing", False):
+            # workers use their own cursor, they would not see the test data
+            return 1
+        return max(worker_count, 1)
+
+    @api.model
+    def _get_draft_orders_domain(self, rule_set_version):
+        """Domain of the draft orders to check
+
+        Unless the rules changed since the last complete check, the
+        orders not modified since their last check, which still have
+        their fingerprint, are skipped.
+        """
+        domain = [("state", "=", "draft")]
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        if get_param("sale_exception.draft_orders_rule_set_version") == (
+            rule_set_version
+        ):
+            domain.append(("exception_fingerprint", "=", False))
+        return domain
+
+    @api.model
+    def _get_draft_orders_partitions(self, domain, batch_size):
+        """Split the orders to check in ranges of ids of batch_size orders"""
+        order_ids = self.search(domain, order="id").ids
+        return [
+            (batch_ids[0], batch_ids[-1], len(batch_ids))
+            for batch_ids in split_every(batch_size, order_ids)
+        ]
+
+    @api.model
+    def _check_draft_orders_partition(self, domain, first_id, last_id):
+        orders = self.search(domain + [("id", ">=", first_id), ("id", "<=", last_id)])
+        orders.detect_exceptions()
+
+    @api.model
+    def _run_draft_orders_partition(self, domain, first_id, last_id):
+        """Check a partition of the draft orders in its own transaction
+
+        Called from a worker thread.
+        """
+        dbname = self.env.cr.dbname
+        uid, context = self.env.uid, self.env.context
+        threading.currentThread().dbname = dbname
+        with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+            orders = api.Environment(cr, uid, context)[self._name]
+            orders._check_draft_orders_partition(domain, first_id, last_id)
+
     @api.model
     def test_all_draft_orders(self):
-        order_set = self.search([("state", "=", "draft")])
-        order_set.detect_exceptions()
+        """Detect the exceptions of the draft orders, by partitions of ids
+
+        Each partition is checked and committed in its own transaction,
+        by a pool of worker threads when several are configured. The
+        threads share the GIL of the process: they only overlap the time
+        spent waiting for PostgreSQL, which releases it, while the Python
+        evaluation of the rules stays serial. Threads are used rather than
+        processes because Odoo cannot fork a worker with its registry from
+        a scheduled action, and the rules mostly run queries.
+        """
+        rule_set_version = self.env["exception.rule"]._get_rule_set_version(
+            ("sale.order", "sale.order.line")
+        )
+        domain = self._get_draft_orders_domain(rule_set_version)
+        partitions = self._get_draft_orders_partitions(
+            domain, self._get_draft_orders_batch_size()
+        )
+        total = sum(count for __, __, count in partitions)
+        checked = failed = 0
+        worker_count = self._get_draft_orders_worker_count()
+        if worker_count > 1:
+            with ThreadPoolExecutor(max_workers=worker_count) as executor:
+                run_partition = self._run_draft_orders_partition
+                futures = [
+                    (executor.submit(run_partition, domain, first_id, last_id), count)
+                    for first_id, last_id, count in partitions
+                ]
+                for future, count in futures:
+                    try:
+                        future.result()
+                    except Exception:
+                        # the orders of the partition keep no fingerprint,
+                        # they are checked again by the next run
+                        failed += 1
+                        _logger.exception(
+                            "Error while detecting the sale exceptions of "
+                            "draft orders"
+                        )
+                    checked += count
+                    _logger.info(
+                        "Sale exceptions detected on %s/%s draft orders",
+                        checked,
+                        total,
+                    )
+        else:
+            for first_id, last_id, count in partitions:
+                self._check_draft_orders_partition(domain, first_id, last_id)
+                if not getattr(threading.currentThread(), "testing", False):
+                    self.env.cr.commit()  # pylint: disable=invalid-commit
+                checked += count
+                _logger.info(
+                    "Sale exceptions detected on %s/%s draft orders", checked, total
+                )
+        self.env["exception.rule"]._flush_profiles()
+        config_parameter = self.env["ir.config_parameter"].sudo()
+        param = "sale_exception.draft_orders_rule_set_version"
+        # setting a parameter clears the caches of the registry
+        if not failed and config_parameter.get_param(param) != rule_set_version:
+            config_parameter.set_param(param, rule_set_version)
         return True
 
     def _fields_trigger_check_exception(self):
@@ -53,18 +455,124 @@ class SaleOrder(models.Model):
         return record
 
     def write(self, vals):
-        result = super(SaleOrder, self).write(vals)
+        # the exceptions are written on the orders by the detection itself
+        if set(vals) - {"exception_ids"}:
+            self._reset_exception_fingerprints()
         check_exceptions = any(
             field in vals for field in self._fields_trigger_check_exception()
         )
+        lines_before = self.mapped("order_line") if check_exceptions else None
+        result = super(SaleOrder, self).write(vals)
         if check_exceptions:
-            self.sale_check_exception()
+            self.sale_check_exception(vals=vals, lines_before=lines_before)
         return result
 
-    def sale_check_exception(self):
+    def sale_check_exception(self, vals=None, lines_before=None):
+        """Check the exceptions of the confirmed orders
+
+        When the values written on the orders and their lines before the
+        write are given, only the rules depending on the modified fields
+        are checked again, see ``_detect_exceptions_for_changes``.
+        """
         orders = self.filtered(lambda s: s.state == "sale")
-        if orders:
+        if not orders:
+            return
+        if (
+            vals is None
+            or lines_before is None
+            or "state" in vals
+            or "ignore_exception" in vals
+        ):
             orders._check_exception()
+            return
+        orders = orders.filtered(lambda s: not s.ignore_exception)
+        if not orders:
+            return
+        order_fields, line_fields, updated_lines = self._get_changed_fields(vals)
+        new_lines = orders.mapped("order_line") - lines_before
+        orders._detect_exceptions_for_changes(
+            order_fields | line_fields, updated_lines | new_lines, new_lines
+        )
+        exceptions = orders.mapped("exception_ids")
+        if exceptions:
+            raise ValidationError("\n".join(exceptions.mapped("name")))
+
+    @api.model
+    def _get_changed_fields(self, vals):
+        """Return the fields changed by a write and the lines it updates
+
+        The fields are returned as sets of (model name, field name), for
+        the orders and for the lines.
+        """
+        order_fields = {(self._name, field) for field in vals}
+        line_fields = set()
+        updated_line_ids = []
+        for command in vals.get("order_line") or []:
+            if command[0] in (0, 1) and command[2]:
+                line_fields |= {("sale.order.line", field) for field in command[2]}
+            if command[0] == 1:
+                updated_line_ids.append(command[1])
+        updated_lines = self.env["sale.order.line"].browse(updated_line_ids).exists()
+        return order_fields, line_fields, updated_lines
+
+    def _detect_exceptions_for_changes(self, changed_fields, lines, new_lines):
+        """Detect the exceptions of the rules depending on changed fields
+
+        Order rules are checked again when they depend on one of the
+        ``changed_fields``, or when the lines are modified, as the fields of
+        the order computed from its lines, like its amounts, may change
+        with them. Line rules are checked on the new lines, and
+        on the modified ``lines`` when they depend on one of the changed
+        fields of the lines, or on all the lines when they depend on a
+        changed field of the order. Rules without dependencies are always
+        checked on the whole order.
+
+        The result of the other rules on the lines, stored in their
+        ``exception_ids``, is kept.
+        """
+        rule_obj = self.env["exception.rule"].sudo()
+        all_lines = self.mapped("order_line")
+        order_changed_fields = {
+            field for field in changed_fields if field[0] == self._name
+        }
+        lines_changed = (self._name, "order_line") in changed_fields
+        checked_rules = rule_obj.browse()
+        exceptions = {order: rule_obj.browse() for order in self}
+        for rule in rule_obj.search(self._rule_domain()):
+            if (
+                rule.trigger_field_ids
+                and not lines_changed
+                and not rule._is_triggered(changed_fields)
+            ):
+                continue
+            checked_rules |= rule
+            for order in self._detect_exceptions(rule):
+                exceptions[order] |= rule
+        line_rules = rule_obj.search(all_lines._rule_domain())
+        checked_rules |= line_rules
+        for rule in line_rules:
+            if not rule.trigger_field_ids or rule._is_triggered(order_changed_fields):
+                rule_lines = all_lines
+            elif rule._is_triggered(changed_fields):
+                rule_lines = lines | new_lines
+            else:
+                rule_lines = new_lines
+            if rule_lines:
+                rule_lines._detect_exceptions(rule)
+        # the exceptions of the lines, checked again or not, are reported
+        # on their order, which is written only when its exceptions change
+        for order in self:
+            order_exceptions = (order.exception_ids - checked_rules) | exceptions[order]
+            order_exceptions |= order.order_line.mapped("exception_ids") & line_rules
+            to_remove = order.exception_ids - order_exceptions
+            to_add = order_exceptions - order.exception_ids
+            if to_remove or to_add:
+                order.write(
+                    {
+                        "exception_ids": [(3, rule.id) for rule in to_remove]
+                        + [(4, rule.id) for rule in to_add]
+                    }
+                )
 
     @api.onchange("order_line")
     def onchange_ignore_exception(self):
@@ -37,6 +37,22 @@ class SaleOrderLine(models.Model):
             ]
         )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records.mapped("order_id")._reset_exception_fingerprints()
+        return records
+
+    def write(self, vals):
+        # the exceptions are written on the lines by the detection itself
+        if set(vals) - {"exception_ids"}:
+            self.mapped("order_id")._reset_exception_fingerprints()
+        return super().write(vals)
+
+    def unlink(self):
+        self.mapped("order_id")._reset_exception_fingerprints()
+        return super().unlink()
+
     def _get_main_records(self):
         return self.mapped("order_id")
 
@@ -45,7 +61,8 @@ class SaleOrderLine(models.Model):
         return "sale_ids"
 
     def _detect_exceptions(self, rule):
-        records = super()._detect_exceptions(rule)
+        with rule._profile(self):
+            records = super()._detect_exceptions(rule)
         # Thanks to the new flush of odoo 13.0, queries will be optimized
         # together at the end even if we update the exception_ids many times.
         # On previous versions, this could be unoptimized.
@@ -1,5 +1,7 @@
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
+import mock
+
 from odoo.addons.sale.tests.test_sale_common import TestCommonSaleNoChart
 
 
@@ -123,3 +125,179 @@ class TestSaleExceptionMultiRecord(TestCommonSaleNoChart):
         self.assertTrue(exception_no_sol.id in all_detected)
         self.assertTrue(exception_no_dumping.id in all_detected)
         self.assertTrue(exception_no_free.id in all_detected)
+
+    def test_draft_orders_batches(self):
+        exception_no_dumping = self.env.ref("sale_exception.excep_no_dumping")
+        exception_no_dumping.active = True
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_exception.draft_orders_batch_size", "1"
+        )
+        partner = self.env.ref("base.res_partner_1")
+        product = self.env.ref("product.product_product_7")
+        orders = self.env["sale.order"].create(
+            [
+                {
+                    "partner_id": partner.id,
+                    "pricelist_id": self.env.ref("product.list0").id,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": product.name,
+                                "product_id": product.id,
+                                "product_uom_qty": 2,
+                                "product_uom": product.uom_id.id,
+                                "price_unit": price_unit,
+                            },
+                        )
+                    ],
+                }
+                for price_unit in (product.list_price, product.list_price / 2)
+            ]
+        )
+        self.env["sale.order"].test_all_draft_orders()
+        self.assertFalse(orders[0].exception_ids)
+        self.assertEqual(orders[1].exception_ids, exception_no_dumping)
+
+    def test_detection_fingerprint(self):
+        exception_no_dumping = self.env.ref("sale_exception.excep_no_dumping")
+        exception_no_dumping.active = True
+        partner = self.env.ref("base.res_partner_1")
+        product = self.env.ref("product.product_product_7")
+        order = self.env["sale.order"].create(
+            {
+                "partner_id": partner.id,
+                "pricelist_id": self.env.ref("product.list0").id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": product.name,
+                            "product_id": product.id,
+                            "product_uom_qty": 2,
+                            "product_uom": product.uom_id.id,
+                            "price_unit": product.list_price / 2,
+                        },
+                    )
+                ],
+            }
+        )
+        self.assertEqual(order.detect_exceptions(), [exception_no_dumping.id])
+        self.assertTrue(order.exception_fingerprint)
+        line_model = type(self.env["sale.order.line"])
+        with mock.patch.object(
+            line_model, "_detect_exceptions", autospec=True
+        ) as mocked:
+            # nothing changed, the stored result is returned
+            self.assertEqual(order.detect_exceptions(), [exception_no_dumping.id])
+            mocked.assert_not_called()
+        # a modified line resets the fingerprint
+        order.order_line.price_unit = product.list_price
+        self.assertFalse(order.exception_fingerprint)
+        self.assertFalse(order.detect_exceptions())
+        self.assertFalse(order.exception_ids)
+        self.assertTrue(order.exception_fingerprint)
+        # so does a modified rule
+        fingerprint = order.exception_fingerprint
+        exception_no_dumping.code = "failed = True"
+        order.detect_exceptions()
+        self.assertEqual(order.exception_ids, exception_no_dumping)
+        self.assertNotEqual(order.exception_fingerprint, fingerprint)
+        # and a modified order
+        order.note = "Modified"
+        self.assertFalse(order.exception_fingerprint)
+
+    def test_rule_profile(self):
+        exception_no_sol = self.env.ref("sale_exception.excep_no_sol")
+        exception_no_dumping = self.env.ref("sale_exception.excep_no_dumping")
+        (exception_no_sol + exception_no_dumping).write({"active": True})
+        partner = self.env.ref("base.res_partner_1")
+        product = self.env.ref("product.product_product_7")
+        order = self.env["sale.order"].create(
+            {
+                "partner_id": partner.id,
+                "pricelist_id": self.env.ref("product.list0").id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": product.name,
+                            "product_id": product.id,
+                            "product_uom_qty": qty,
+                            "product_uom": product.uom_id.id,
+                            "price_unit": product.list_price,
+                        },
+                    )
+                    for qty in (1, 2)
+                ],
+            }
+        )
+        # the profiling is disabled by default
+        order.detect_exceptions()
+        self.assertFalse(exception_no_dumping.profile_count)
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_exception.profile_rules", "1"
+        )
+        order.exception_fingerprint = False
+        order.detect_exceptions()
+        # the profiles are kept in memory until they are flushed
+        self.env["exception.rule"]._flush_profiles()
+        self.assertEqual(exception_no_sol.profile_count, 1)
+        self.assertEqual(exception_no_dumping.profile_count, 2)
+        self.assertTrue(exception_no_sol.profile_query_count)
+        self.assertGreater(exception_no_dumping.profile_time, 0)
+        (exception_no_sol + exception_no_dumping).action_reset_profile()
+        self.assertFalse(exception_no_dumping.profile_count)
+
+    def test_draft_orders_skip_unmodified(self):
+        exception_no_dumping = self.env.ref("sale_exception.excep_no_dumping")
+        exception_no_dumping.active = True
+        partner = self.env.ref("base.res_partner_1")
+        product = self.env.ref("product.product_product_7")
+        sale_order = self.env["sale.order"]
+        orders = sale_order.create(
+            [
+                {
+                    "partner_id": partner.id,
+                    "pricelist_id": self.env.ref("product.list0").id,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": product.name,
+                                "product_id": product.id,
+                                "product_uom_qty": 2,
+                                "product_uom": product.uom_id.id,
+                                "price_unit": product.list_price,
+                            },
+                        )
+                    ],
+                }
+                for __ in range(2)
+            ]
+        )
+        sale_order.test_all_draft_orders()
+        self.assertTrue(all(orders.mapped("exception_fingerprint")))
+        orders[0].note = "Modified"
+
+        def get_orders_to_check():
+            rule_set_version = self.env["exception.rule"]._get_rule_set_version(
+                ("sale.order", "sale.order.line")
+            )
+            domain = sale_order._get_draft_orders_domain(rule_set_version)
+            return sale_order.search(domain) & orders
+
+        self.assertEqual(get_orders_to_check(), orders[0])
+        # all the orders are checked again when a rule changed
+        exception_no_dumping.code = "failed = obj.price_unit < 0"
+        self.assertEqual(get_orders_to_check(), orders)
+        partitions = sale_order._get_draft_orders_partitions(
+            [("id", "in", orders.ids)], 1
+        )
+        self.assertEqual(
+            partitions, [(order.id, order.id, 1) for order in orders.sorted("id")]
+        )
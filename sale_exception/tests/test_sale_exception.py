@@ -3,6 +3,8 @@
 # Copyright 2019 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
+import mock
+
 from odoo.exceptions import ValidationError
 
 from odoo.addons.sale.tests.test_sale_common import TestCommonSaleNoChart
@@ -133,3 +135,118 @@ class TestSaleException(TestCommonSaleNoChart):
         ).create({"ignore": True})
         so_except_confirm.action_confirm()
         self.assertTrue(so1.ignore_exception)
+
+    def _get_field(self, model, name):
+        return self.env["ir.model.fields"].search(
+            [("model", "=", model), ("name", "=", name)]
+        )
+
+    def test_sale_order_exception_trigger_fields(self):
+        partner = self.env.ref("base.res_partner_1")
+        p = self.env.ref("product.product_product_6")
+        p.standard_price = 10
+        exception = self.env.ref("sale_exception.excep_no_dumping")
+        exception.write(
+            {
+                "active": True,
+                "trigger_field_ids": [
+                    (6, 0, self._get_field("sale.order.line", "price_unit").ids)
+                ],
+            }
+        )
+        so = self.env["sale.order"].create(
+            {
+                "partner_id": partner.id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": p.name,
+                            "product_id": p.id,
+                            "product_uom_qty": 2,
+                            "product_uom": p.uom_id.id,
+                            "price_unit": 20,
+                        },
+                    )
+                ],
+            }
+        )
+        so.action_confirm()
+        self.assertEqual(so.state, "sale")
+        line = so.order_line
+        # the rule does not depend on the quantity, the line is not checked
+        # again even if it would be an exception now
+        p.standard_price = 30
+        so.write({"order_line": [(1, line.id, {"product_uom_qty": 3})]})
+        self.assertFalse(line.exception_ids)
+        # the rule depends on the price, the line is checked again
+        with self.assertRaises(ValidationError), self.env.cr.savepoint():
+            so.write({"order_line": [(1, line.id, {"price_unit": 25})]})
+        # new lines are always checked
+        with self.assertRaises(ValidationError), self.env.cr.savepoint():
+            so.write(
+                {
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": p.name,
+                                "product_id": p.id,
+                                "product_uom_qty": 1,
+                                "product_uom": p.uom_id.id,
+                                "price_unit": 20,
+                            },
+                        )
+                    ]
+                }
+            )
+        so.write({"order_line": [(1, line.id, {"price_unit": 35})]})
+        self.assertFalse(line.exception_ids)
+        self.assertFalse(so.exception_ids)
+        # the order is not written again when its exceptions do not change
+        order_class = type(so)
+        with mock.patch.object(
+            order_class, "write", autospec=True, side_effect=order_class.write
+        ) as mocked:
+            so.write({"order_line": [(1, line.id, {"price_unit": 36})]})
+        self.assertEqual(mocked.call_count, 1)
+
+    def test_sale_order_exception_trigger_fields_amount(self):
+        partner = self.env.ref("base.res_partner_1")
+        p = self.env.ref("product.product_product_6")
+        self.env["exception.rule"].create(
+            {
+                "name": "Max amount",
+                "description": "Max amount",
+                "sequence": 50,
+                "model": "sale.order",
+                "code": "if obj.amount_untaxed > 100: failed = True",
+                "trigger_field_ids": [
+                    (6, 0, self._get_field("sale.order", "amount_untaxed").ids)
+                ],
+            }
+        )
+        so = self.env["sale.order"].create(
+            {
+                "partner_id": partner.id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": p.name,
+                            "product_id": p.id,
+                            "product_uom_qty": 2,
+                            "product_uom": p.uom_id.id,
+                            "price_unit": 20,
+                        },
+                    )
+                ],
+            }
+        )
+        so.action_confirm()
+        # the amount computed from the lines is checked again
+        with self.assertRaises(ValidationError):
+            so.write({"order_line": [(1, so.order_line.id, {"product_uom_qty": 10})]})
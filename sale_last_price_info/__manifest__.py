@@ -3,7 +3,7 @@
 
 {
     "name": "Product Last Price Info - Sale",
-    "version": "13.0.1.0.0",
+    "version": "13.0.3.0.0",
     "author": "AvanzOSC, Tecnativa, Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/sale-workflow",
     "category": "Sales",
@@ -16,6 +16,12 @@
         "Serpent Consulting Services Pvt. Ltd. <support@serpentcs.com>",
     ],
     "depends": ["sale_management"],
-    "data": ["views/product_view.xml"],
+    "data": [
+        "security/ir.model.access.csv",
+        "security/product_last_sale_security.xml",
+        "views/product_view.xml",
+        "views/product_last_sale_views.xml",
+    ],
+    "post_init_hook": "post_init_hook",
     "installable": True,
 }
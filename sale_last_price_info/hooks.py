@@ -0,0 +1,24 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import logging
+
+from odoo import SUPERUSER_ID, api
+
+from .models.sale import LAST_SALE_STATES
+
+_logger = logging.getLogger(__name__)
+
+
+def compute_last_sales(cr):
+    """Compute the last sales of all the products sold"""
+    _logger.info("Compute the last sales of the products")
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute(
+        "SELECT DISTINCT product_id FROM sale_order_line "
+        "WHERE product_id IS NOT NULL AND state IN %s",
+        (LAST_SALE_STATES,),
+    )
+    env["product.last.sale"]._refresh([row[0] for row in cr.fetchall()])
+
+
+def post_init_hook(cr, registry):
+    compute_last_sales(cr)
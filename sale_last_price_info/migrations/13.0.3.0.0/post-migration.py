@@ -0,0 +1,7 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.addons.sale_last_price_info.hooks import compute_last_sales
+
+
+def migrate(cr, version):
+    compute_last_sales(cr)
@@ -2,3 +2,4 @@
 
 from . import sale
 from . import product
+from . import product_last_sale
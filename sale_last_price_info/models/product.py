@@ -1,30 +1,246 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+import time
+
+from odoo import api, fields, models
+from odoo.tools.lru import LRU
+
+from .sale import LAST_SALE_STATES
+
+# Last sale of a product to a customer, by (database, company, product,
+# commercial partner), then by the user and allowed companies it was read
+# with, as the record rules apply. The cache is local to the worker process:
+# the entries are dropped when a matching order is confirmed or cancelled in
+# this process, and expire after a delay for the changes done by the other
+# processes.
+LAST_SALE_PARTNER_CACHE = LRU(8192)
 
 
 class ProductProduct(models.Model):
     _inherit = "product.product"
 
+    def _get_last_sales(self):
+        """Return the last sale of the products in the current company, by
+        product id
+
+        Empty for the users not allowed to read the last sales.
+        """
+        last_sale_obj = self.env["product.last.sale"]
+        product_ids = [pid for pid in self.ids if isinstance(pid, int)]
+        if not product_ids or not last_sale_obj.check_access_rights(
+            "read", raise_exception=False
+        ):
+            return {}
+        last_sales = last_sale_obj.search(
+            [
+                ("product_id", "in", product_ids),
+                ("company_id", "=", self.env.company.id),
+            ]
+        )
+        return {last_sale.product_id.id: last_sale for last_sale in last_sales}
+
+    @api.depends_context("company")
     def _compute_last_sale(self):
-        """ Get last sale price, last sale date and last customer """
-        so_line_obj = self.env["sale.order.line"]
+        """ Get last sale price, last sale date and last customer
+
+        They are read from the last sales precomputed by company, the ones
+        of the current company.
+        """
+        last_sales = self._get_last_sales()
+        last_sale_obj = self.env["product.last.sale"]
         for product in self:
-            line = so_line_obj.search(
-                [("product_id", "=", product.id), ("state", "in", ["sale", "done"])],
-                limit=1,
-                order="date_order_sale_last_price_info desc",
-            )
-            product.last_sale_date = fields.Datetime.to_string(
-                line.date_order_sale_last_price_info
+            last_sale = last_sales.get(product.id, last_sale_obj)
+            product.last_sale_date = last_sale.date
+            product.last_sale_price = last_sale.price_unit
+            product.last_customer_id = last_sale.partner_id
+
+    def _search_last_sale_field(self, fname, operator, value):
+        """Search the products on a field of their last sale in the current
+        company
+
+        The products without sale have empty values.
+        """
+        last_sale_obj = self.env["product.last.sale"]
+        company_domain = [("company_id", "=", self.env.company.id)]
+        last_sales = last_sale_obj.search(company_domain + [(fname, operator, value)])
+        domain = [("id", "in", last_sales.mapped("product_id").ids)]
+        if (operator in ("=", "in") and not value) or (
+            operator in ("!=", "not in") and value
+        ):
+            sold_products = last_sale_obj.search(company_domain).mapped("product_id")
+            domain = ["|", ("id", "not in", sold_products.ids)] + domain
+        return domain
+
+    def _search_last_sale_price(self, operator, value):
+        return self._search_last_sale_field("price_unit", operator, value)
+
+    def _search_last_sale_date(self, operator, value):
+        return self._search_last_sale_field("date", operator, value)
+
+    def _search_last_customer_id(self, operator, value):
+        return self._search_last_sale_field("partner_id", operator, value)
+
+    @api.model
+    def _get_last_sale_cache_ttl(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("sale_last_price_info.cache_ttl", 300))
+
+    @api.model
+    def _get_last_sale_cache_key(self, company_id, product_id, commercial_partner_id):
+        return (self.env.cr.dbname, company_id, product_id, commercial_partner_id)
+
+    @api.model
+    def _get_last_sale_cache_access_key(self):
+        """Return what the sales read in the cache depend on, besides the
+        key: the user and its allowed companies, for the record rules
+        """
+        return (self.env.uid, self.env.su, tuple(sorted(self.env.companies.ids)))
+
+    @api.model
+    def _invalidate_last_sale_cache(self, keys):
+        for key in keys:
+            try:
+                del LAST_SALE_PARTNER_CACHE[key]
+            except KeyError:
+                pass
+
+    @api.model
+    def _read_last_sale_by_partner(
+        self, company_id, product_ids, commercial_partner_ids
+    ):
+        """Read the last confirmed line of the products for each partner
+
+        Return a dict {(product id, commercial partner id): info} for the
+        pairs having a sale in the company, among the lines the user can
+        read.
+        """
+        so_line_obj = self.env["sale.order.line"]
+        domain = [
+            ("state", "in", LAST_SALE_STATES),
+            ("company_id", "=", company_id),
+            ("product_id", "in", list(product_ids)),
+            (
+                "order_partner_id.commercial_partner_id",
+                "in",
+                list(commercial_partner_ids),
+            ),
+        ]
+        so_line_obj._flush_search(
+            domain,
+            fields=[
+                "price_unit",
+                "product_uom_qty",
+                "product_uom",
+                "date_order_sale_last_price_info",
+            ],
+        )
+        query = so_line_obj._where_calc(domain)
+        so_line_obj._apply_ir_rules(query, "read")
+        from_clause, where_clause, where_params = query.get_sql()
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (sol.product_id, rp.commercial_partner_id)
+                sol.product_id, rp.commercial_partner_id, sol.id,
+                sol.price_unit, sol.date_order_sale_last_price_info,
+                sol.product_uom_qty, sol.product_uom
+            FROM sale_order_line sol
+            JOIN res_partner rp ON rp.id = sol.order_partner_id
+            WHERE sol.id IN (SELECT sale_order_line.id FROM {} WHERE {})
+            ORDER BY sol.product_id, rp.commercial_partner_id,
+                sol.date_order_sale_last_price_info DESC, sol.id DESC
+            """.format(
+                from_clause, where_clause
+            ),
+            where_params,
+        )
+        return {
+            (product_id, partner_id): {
+                "sale_line_id": line_id,
+                "price_unit": price_unit,
+                "date": date,
+                "product_uom_qty": qty,
+                "product_uom_id": uom_id,
+            }
+            for (
+                product_id,
+                partner_id,
+                line_id,
+                price_unit,
+                date,
+                qty,
+                uom_id,
+            ) in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _get_last_sale_by_partner(self, pairs, company=None):
+        """Return the last sale of products to customers
+
+        ``pairs`` is an iterable of (product id, commercial partner id).
+        Return a dict {(product id, commercial partner id): info}, info
+        being a dict with the price unit, the order date, the quantity and
+        its unit of measure, and the sale order line, or None when the
+        product has never been sold to the partner in the company, the
+        current one by default.
+
+        The pairs not in the cache are read with a single query.
+        """
+        company_id = (company or self.env.company).id
+        access_key = self._get_last_sale_cache_access_key()
+        now = time.monotonic()
+        ttl = self._get_last_sale_cache_ttl()
+        result = {}
+        missing = set()
+        for pair in set(pairs):
+            key = self._get_last_sale_cache_key(company_id, *pair)
+            cached = (LAST_SALE_PARTNER_CACHE.get(key) or {}).get(access_key)
+            if cached and now - cached[0] < ttl:
+                result[pair] = cached[1]
+            else:
+                missing.add(pair)
+        if missing:
+            values = self._read_last_sale_by_partner(
+                company_id,
+                {product_id for product_id, __ in missing},
+                {partner_id for __, partner_id in missing},
             )
-            product.last_sale_price = line.price_unit
-            product.last_customer_id = line.order_id.partner_id
+            for pair in missing:
+                result[pair] = values.get(pair)
+                key = self._get_last_sale_cache_key(company_id, *pair)
+                entries = dict(LAST_SALE_PARTNER_CACHE.get(key) or {})
+                entries[access_key] = (now, result[pair])
+                LAST_SALE_PARTNER_CACHE[key] = entries
+        return result
+
+    def _get_last_sale_for_partner(self, partner):
+        """Return the last sale of the products to the commercial entity of
+        the partner, by product id, see ``_get_last_sale_by_partner``
+        """
+        commercial_partner_id = partner.commercial_partner_id.id
+        pairs = [(product.id, commercial_partner_id) for product in self]
+        last_sales = self._get_last_sale_by_partner(pairs)
+        return {pair[0]: last_sales[pair] for pair in pairs}
+
+    def _update_last_sale(self):
+        """Compute again the last sales of the products"""
+        self.env["product.last.sale"].sudo()._refresh(self.ids)
+        self.invalidate_cache(
+            ["last_sale_price", "last_sale_date", "last_customer_id"], self.ids
+        )
 
     last_sale_price = fields.Float(
-        string="Last Sale Price", compute="_compute_last_sale"
+        string="Last Sale Price",
+        compute="_compute_last_sale",
+        search="_search_last_sale_price",
+    )
+    last_sale_date = fields.Date(
+        string="Last Sale Date",
+        compute="_compute_last_sale",
+        search="_search_last_sale_date",
     )
-    last_sale_date = fields.Date(string="Last Sale Date", compute="_compute_last_sale")
     last_customer_id = fields.Many2one(
-        comodel_name="res.partner", string="Last Customer", compute="_compute_last_sale"
+        comodel_name="res.partner",
+        string="Last Customer",
+        compute="_compute_last_sale",
+        search="_search_last_customer_id",
     )
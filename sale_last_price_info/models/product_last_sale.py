@@ -0,0 +1,91 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models
+
+from .sale import LAST_SALE_STATES
+
+
+class ProductLastSale(models.Model):
+    """Last confirmed sale of a product by company
+
+    Precomputed from the sales order lines, so that the last sale info of
+    the products costs a lookup on the product and the current company.
+    The rows of a product are computed again when its confirmed lines
+    change.
+    """
+
+    _name = "product.last.sale"
+    _description = "Last sale of a product by company"
+    _log_access = False
+    _order = "date desc, id desc"
+
+    product_id = fields.Many2one(
+        "product.product", required=True, index=True, ondelete="cascade"
+    )
+    company_id = fields.Many2one("res.company", required=True, ondelete="cascade")
+    sale_line_id = fields.Many2one("sale.order.line", string="Sale Order Line")
+    partner_id = fields.Many2one("res.partner", string="Last Customer")
+    date = fields.Date(string="Last Sale Date")
+    price_unit = fields.Float(string="Last Sale Price", digits="Product Price")
+
+    _sql_constraints = [
+        (
+            "product_company_uniq",
+            "unique(product_id, company_id)",
+            "The last sale of a product by company must be unique.",
+        )
+    ]
+
+    @api.model
+    def _refresh(self, product_ids):
+        """Compute again the last sales of the products in all the companies
+
+        The rows are inserted or updated in place, so that transactions
+        refreshing the same products wait for each other instead of
+        failing, then the rows of the companies without sale anymore are
+        deleted.
+        """
+        if not product_ids:
+            return
+        self.env["sale.order.line"].flush(
+            [
+                "product_id",
+                "company_id",
+                "state",
+                "price_unit",
+                "date_order_sale_last_price_info",
+                "order_id",
+            ]
+        )
+        self.env["sale.order"].flush(["partner_id"])
+        self.env.cr.execute(
+            """
+            WITH last_sale AS (
+                SELECT DISTINCT ON (sol.product_id, sol.company_id)
+                    sol.product_id, sol.company_id, sol.id AS sale_line_id,
+                    so.partner_id, sol.date_order_sale_last_price_info::date,
+                    sol.price_unit
+                FROM sale_order_line sol
+                JOIN sale_order so ON so.id = sol.order_id
+                WHERE sol.product_id IN %s AND sol.state IN %s
+                ORDER BY sol.product_id, sol.company_id,
+                    sol.date_order_sale_last_price_info DESC, sol.id DESC
+            ), refreshed AS (
+                INSERT INTO product_last_sale (
+                    product_id, company_id, sale_line_id, partner_id, date,
+                    price_unit
+                )
+                SELECT * FROM last_sale
+                ON CONFLICT (product_id, company_id) DO UPDATE SET
+                    sale_line_id = EXCLUDED.sale_line_id,
+                    partner_id = EXCLUDED.partner_id,
+                    date = EXCLUDED.date,
+                    price_unit = EXCLUDED.price_unit
+                RETURNING id
+            )
+            DELETE FROM product_last_sale
+            WHERE product_id IN %s AND id NOT IN (SELECT id FROM refreshed)
+            """,
+            (tuple(product_ids), LAST_SALE_STATES, tuple(product_ids)),
+        )
+        self.invalidate_cache()
@@ -1,6 +1,26 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from odoo import api, fields, models
+
+LAST_SALE_STATES = ("sale", "done")
+
+
+class SaleOrder(models.Model):
+    _inherit = "sale.order"
+
+    def _get_confirmed_lines(self):
+        confirmed = self.filtered(lambda order: order.state in LAST_SALE_STATES)
+        return confirmed.mapped("order_line")
+
+    def write(self, vals):
+        if not {"state", "date_order", "partner_id"} & set(vals):
+            return super().write(vals)
+        lines = self._get_confirmed_lines()
+        cache_keys = lines._get_last_sale_cache_keys()
+        res = super().write(vals)
+        lines |= self._get_confirmed_lines()
+        lines._update_last_sale(cache_keys)
+        return res
 
 
 class SaleOrderLine(models.Model):
@@ -9,3 +29,87 @@ class SaleOrderLine(models.Model):
     date_order_sale_last_price_info = fields.Datetime(
         string="Order date", related="order_id.date_order", store=True, index=True
     )
+
+    def _get_confirmed_lines(self):
+        return self.filtered(lambda line: line.state in LAST_SALE_STATES)
+
+    def _get_last_sale_cache_keys(self):
+        product_obj = self.env["product.product"]
+        return {
+            product_obj._get_last_sale_cache_key(
+                line.company_id.id,
+                line.product_id.id,
+                line.order_partner_id.commercial_partner_id.id,
+            )
+            for line in self
+        }
+
+    def _update_last_sale(self, cache_keys=()):
+        """Update the last sale info of the products of the lines
+
+        ``cache_keys`` are the keys of the last sales by customer to
+        invalidate on top of the ones of the lines, for the values of the
+        lines before a write.
+        """
+        self.mapped("product_id")._update_last_sale()
+        self.env["product.product"]._invalidate_last_sale_cache(
+            set(cache_keys) | self._get_last_sale_cache_keys()
+        )
+
+    def _get_last_sale_for_partner(self):
+        """Return the last sale of the product of the lines to the customer
+        of their order, by line id, see
+        ``product.product._get_last_sale_by_partner``
+
+        The lines of a whole order are looked up at once.
+        """
+        product_obj = self.env["product.product"]
+        result = {}
+        for company in self.mapped("company_id"):
+            lines = self.filtered(lambda line: line.company_id == company)
+            pairs = {
+                line.id: (
+                    line.product_id.id,
+                    line.order_partner_id.commercial_partner_id.id,
+                )
+                for line in lines
+                if line.product_id
+            }
+            last_sales = product_obj._get_last_sale_by_partner(
+                pairs.values(), company=company
+            )
+            result.update(
+                {line_id: last_sales[pair] for line_id, pair in pairs.items()}
+            )
+        return result
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._get_confirmed_lines()._update_last_sale()
+        return lines
+
+    def write(self, vals):
+        if not {
+            "product_id",
+            "price_unit",
+            "product_uom_qty",
+            "product_uom",
+            "order_id",
+        } & set(vals):
+            return super().write(vals)
+        lines = self._get_confirmed_lines()
+        cache_keys = lines._get_last_sale_cache_keys()
+        res = super().write(vals)
+        lines |= self._get_confirmed_lines()
+        lines._update_last_sale(cache_keys)
+        return res
+
+    def unlink(self):
+        lines = self._get_confirmed_lines()
+        products = lines.mapped("product_id")
+        cache_keys = lines._get_last_sale_cache_keys()
+        res = super().unlink()
+        products._update_last_sale()
+        self.env["product.product"]._invalidate_last_sale_cache(cache_keys)
+        return res
@@ -0,0 +1,139 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import time
+
+from odoo.tests import common, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("post_install", "-at_install", "-standard", "sale_last_price_info_benchmark")
+class TestBenchmarkLastSale(common.SavepointCase):
+    """Compare the computation of the last sale info, product by product
+    and in a single query, with the reading of the precomputed values
+
+    Not part of the standard tests, run it with
+    ``--test-tags sale_last_price_info_benchmark``.
+    """
+
+    product_count = 80
+    order_count = 500
+    line_count = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.products = cls.env["product.product"].create(
+            [
+                {"name": "Benchmark product %s" % index}
+                for index in range(cls.product_count)
+            ]
+        )
+        partners = cls.env["res.partner"].create(
+            [{"name": "Benchmark customer %s" % index} for index in range(10)]
+        )
+        orders = cls.env["sale.order"].create(
+            [
+                {
+                    "partner_id": partners[index % len(partners)].id,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": "Benchmark line",
+                                "product_id": cls.products[
+                                    (index + line_index) % cls.product_count
+                                ].id,
+                                "product_uom": cls.env.ref("uom.product_uom_unit").id,
+                                "product_uom_qty": 1,
+                                "price_unit": index + line_index,
+                            },
+                        )
+                        for line_index in range(cls.line_count)
+                    ],
+                }
+                for index in range(cls.order_count)
+            ]
+        )
+        # the benchmark is about reading the lines, skip the confirmation
+        orders.write({"state": "sale"})
+
+    def _compute_one_by_one(self, products):
+        """The computation done before, with one search by product"""
+        so_line_obj = self.env["sale.order.line"]
+        result = {}
+        for product in products:
+            line = so_line_obj.search(
+                [("product_id", "=", product.id), ("state", "in", ["sale", "done"])],
+                limit=1,
+                order="date_order_sale_last_price_info desc, id desc",
+            )
+            result[product.id] = (
+                line.price_unit,
+                line.date_order_sale_last_price_info,
+                line.order_id.partner_id,
+            )
+        return result
+
+    def _compute_batch(self, products):
+        """The computation of the last sales, in a single query"""
+        last_sale_obj = self.env["product.last.sale"]
+        last_sale_obj._refresh(products.ids)
+        last_sales = {
+            last_sale.product_id.id: last_sale
+            for last_sale in last_sale_obj.search([("product_id", "in", products.ids)])
+        }
+        result = {}
+        for product in products:
+            line = last_sales.get(product.id, last_sale_obj).sale_line_id
+            result[product.id] = (
+                line.price_unit,
+                line.date_order_sale_last_price_info,
+                line.order_id.partner_id,
+            )
+        return result
+
+    def _read_stored(self, products):
+        products.invalidate_cache()
+        return {
+            product.id: (
+                product.last_sale_price,
+                product.last_sale_date,
+                product.last_customer_id,
+            )
+            for product in products
+        }
+
+    def _benchmark(self, method, products):
+        self.env["sale.order.line"].invalidate_cache()
+        query_count = self.env.cr.sql_log_count
+        start = time.perf_counter()
+        result = method(products)
+        duration = time.perf_counter() - start
+        _logger.info(
+            "%s: %s products in %.3fs, %s queries",
+            method.__name__,
+            len(products),
+            duration,
+            self.env.cr.sql_log_count - query_count,
+        )
+        return result, duration
+
+    def test_benchmark_last_sale(self):
+        one_by_one, one_by_one_duration = self._benchmark(
+            self._compute_one_by_one, self.products
+        )
+        batch, batch_duration = self._benchmark(self._compute_batch, self.products)
+        stored, stored_duration = self._benchmark(self._read_stored, self.products)
+        self.assertEqual(batch, one_by_one)
+        for product in self.products:
+            price, date, customer = one_by_one[product.id]
+            self.assertEqual(stored[product.id], (price, date.date(), customer))
+        _logger.info(
+            "single query speedup: x%.1f, stored values speedup: x%.1f",
+            one_by_one_duration / batch_duration,
+            one_by_one_duration / stored_duration,
+        )
@@ -26,3 +26,165 @@ class TestSaleLastPriceInfo(common.TransactionCase):
         )
         self.assertEqual(sale_line.price_unit, self.product.last_sale_price)
         self.assertEqual(sale_line.order_id.partner_id, self.product.last_customer_id)
+
+    def test_sale_last_price_info_batch(self):
+        products = self.env["product.product"].create(
+            [{"name": "Product %s" % index} for index in range(3)]
+        )
+        order = self.sale_order_model.create(
+            {
+                "partner_id": self.partner.id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": product.name,
+                            "product_id": product.id,
+                            "product_uom": product.uom_id.id,
+                            "product_uom_qty": 1,
+                            "price_unit": self.price_unit + index,
+                        },
+                    )
+                    for index, product in enumerate(products[:2])
+                ],
+            }
+        )
+        order.action_confirm()
+        products.invalidate_cache()
+        self.assertEqual(products.mapped("last_sale_price"), [100.0, 101.0, 0.0])
+        self.assertEqual(products[0].last_customer_id, self.partner)
+        self.assertEqual(products[0].last_sale_date, order.date_order.date())
+        self.assertFalse(products[2].last_customer_id)
+        self.assertFalse(products[2].last_sale_date)
+
+    def test_sale_last_price_info_stored(self):
+        product = self.env["product.product"].create({"name": "Stored product"})
+        orders = self.sale_order_model.create(
+            [
+                {
+                    "partner_id": partner.id,
+                    "date_order": date_order,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": product.name,
+                                "product_id": product.id,
+                                "product_uom": product.uom_id.id,
+                                "product_uom_qty": 1,
+                                "price_unit": price_unit,
+                            },
+                        )
+                    ],
+                }
+                for partner, date_order, price_unit in (
+                    (self.partner, "2020-01-01 10:00:00", 10.0),
+                    (self.env.ref("base.res_partner_2"), "2020-02-01 10:00:00", 20.0),
+                )
+            ]
+        )
+        self.assertFalse(product.last_sale_price)
+        orders[0].action_confirm()
+        self.assertEqual(product.last_sale_price, 10.0)
+        orders[1].action_confirm()
+        self.assertEqual(product.last_sale_price, 20.0)
+        # the fields are searchable
+        self.assertEqual(
+            self.env["product.product"].search(
+                [
+                    ("id", "=", product.id),
+                    ("last_customer_id", "=", self.env.ref("base.res_partner_2").id),
+                ]
+            ),
+            product,
+        )
+        orders[1].order_line.price_unit = 25.0
+        self.assertEqual(product.last_sale_price, 25.0)
+        orders[1].action_cancel()
+        self.assertEqual(product.last_sale_price, 10.0)
+        self.assertEqual(product.last_customer_id, self.partner)
+        self.assertEqual(str(product.last_sale_date), "2020-01-01")
+        # the values are the ones of the current company
+        company = self.env["res.company"].create({"name": "Last sale company"})
+        other_order = (
+            orders[1]
+            .with_context(allowed_company_ids=(company + self.env.company).ids)
+            .copy({"company_id": company.id})
+        )
+        other_order.order_line.price_unit = 30.0
+        other_order.action_confirm()
+        self.assertEqual(product.last_sale_price, 10.0)
+        other_product = product.with_context(allowed_company_ids=company.ids)
+        self.assertEqual(other_product.last_sale_price, 30.0)
+        # and are shown to the users seeing only their own orders
+        salesman = self.env["res.users"].create(
+            {
+                "name": "Own documents salesman",
+                "login": "own_documents_salesman",
+                "groups_id": [
+                    (6, 0, self.env.ref("sales_team.group_sale_salesman").ids)
+                ],
+            }
+        )
+        self.assertEqual(product.with_user(salesman).last_sale_price, 10.0)
+
+    def test_sale_last_price_for_partner(self):
+        product = self.env["product.product"].create({"name": "Partner product"})
+        contact = self.env["res.partner"].create(
+            {"name": "Contact", "parent_id": self.partner.id}
+        )
+        other_partner = self.env.ref("base.res_partner_2")
+
+        def create_order(partner, price_unit, qty):
+            return self.sale_order_model.create(
+                {
+                    "partner_id": partner.id,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": product.name,
+                                "product_id": product.id,
+                                "product_uom": product.uom_id.id,
+                                "product_uom_qty": qty,
+                                "price_unit": price_unit,
+                            },
+                        )
+                    ],
+                }
+            )
+
+        self.assertIsNone(product._get_last_sale_for_partner(self.partner)[product.id])
+        order = create_order(contact, 10.0, 3)
+        order.action_confirm()
+        create_order(other_partner, 20.0, 1).action_confirm()
+        # the sales of the contacts are the ones of their commercial entity
+        last_sale = product._get_last_sale_for_partner(self.partner)[product.id]
+        self.assertEqual(last_sale["price_unit"], 10.0)
+        self.assertEqual(last_sale["product_uom_qty"], 3)
+        self.assertEqual(last_sale["sale_line_id"], order.order_line.id)
+        # the cache is invalidated by the confirmation of an order
+        new_order = create_order(self.partner, 15.0, 2)
+        new_order.action_confirm()
+        last_sales = new_order.order_line._get_last_sale_for_partner()
+        self.assertEqual(last_sales[new_order.order_line.id]["price_unit"], 15.0)
+        new_order.action_cancel()
+        last_sales = new_order.order_line._get_last_sale_for_partner()
+        self.assertEqual(last_sales[new_order.order_line.id]["price_unit"], 10.0)
+        # the record rules apply, the sales of the other salesmen are hidden
+        salesman = self.env["res.users"].create(
+            {
+                "name": "Own documents salesman",
+                "login": "own_documents_salesman",
+                "groups_id": [
+                    (6, 0, self.env.ref("sales_team.group_sale_salesman").ids)
+                ],
+            }
+        )
+        last_sales = product.with_user(salesman)._get_last_sale_for_partner(
+            self.partner
+        )
+        self.assertIsNone(last_sales[product.id])
@@ -0,0 +1,25 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def mark_customers_outdated(cr):
+    """Mark the statistics of all the customers with deliveries outdated,
+    to compute them with the next run of the scheduled action
+    """
+    _logger.info("Mark the sale recommendation statistics to compute")
+    cr.execute(
+        """
+        INSERT INTO sale_order_recommendation_outdated (commercial_partner_id)
+        SELECT DISTINCT rp.commercial_partner_id
+        FROM sale_order_line sol
+        JOIN sale_order so ON so.id = sol.order_id
+        JOIN res_partner rp ON rp.id = so.partner_id
+        WHERE sol.qty_delivered != 0
+        """
+    )
+
+
+def post_init_hook(cr, registry):
+    mark_customers_outdated(cr)
@@ -0,0 +1,7 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.addons.sale_order_product_recommendation.hooks import mark_customers_outdated
+
+
+def migrate(cr, version):
+    mark_customers_outdated(cr)
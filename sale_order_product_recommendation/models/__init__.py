@@ -0,0 +1,7 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from . import sale_order
+from . import sale_order_recommendation_outdated
+from . import sale_order_recommendation_stat
+from . import sale_order_recommendation_neighbour
+from . import sale_order_recommendation_score
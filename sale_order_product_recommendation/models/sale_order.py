@@ -0,0 +1,82 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class SaleOrder(models.Model):
+    _inherit = "sale.order"
+
+    def _write(self, vals):
+        if not {"partner_id", "date_order"} & set(vals):
+            return super()._write(vals)
+        # the statistics of both the previous and the new customer
+        self._mark_recommendation_outdated()
+        res = super()._write(vals)
+        self._mark_recommendation_outdated()
+        return res
+
+    def _mark_recommendation_outdated(self):
+        """Mark the statistics of the customers of the orders as outdated
+
+        Done in SQL on the values in database, as it is called while the
+        orders and their lines are written.
+        """
+        if not self.ids:
+            return
+        self.env["sale.order.recommendation.outdated"]._mark_outdated(
+            """
+            SELECT rp.commercial_partner_id
+            FROM sale_order so
+            JOIN res_partner rp ON rp.id = so.partner_id
+            WHERE so.id IN %s
+                AND EXISTS (
+                    SELECT 1 FROM sale_order_line sol
+                    WHERE sol.order_id = so.id AND sol.qty_delivered != 0
+                )
+            """,
+            (tuple(self.ids),),
+        )
+
+
+class SaleOrderLine(models.Model):
+    _inherit = "sale.order.line"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._mark_recommendation_outdated()
+        return lines
+
+    def _write(self, vals):
+        # _write is also called to store the computed quantities delivered
+        if not {"qty_delivered", "product_id", "order_id"} & set(vals):
+            return super()._write(vals)
+        # the lines delivered before or after the write
+        self._mark_recommendation_outdated()
+        res = super()._write(vals)
+        self._mark_recommendation_outdated()
+        return res
+
+    def unlink(self):
+        self._mark_recommendation_outdated()
+        return super().unlink()
+
+    def _mark_recommendation_outdated(self):
+        """Mark the statistics of the customers of the delivered lines as
+        outdated
+
+        Done in SQL on the values in database, as it is called while the
+        lines are written.
+        """
+        if not self.ids:
+            return
+        self.env["sale.order.recommendation.outdated"]._mark_outdated(
+            """
+            SELECT rp.commercial_partner_id
+            FROM sale_order_line sol
+            JOIN sale_order so ON so.id = sol.order_id
+            JOIN res_partner rp ON rp.id = so.partner_id
+            WHERE sol.id IN %s AND sol.qty_delivered != 0
+            """,
+            (tuple(self.ids),),
+        )
@@ -0,0 +1,200 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import time
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from scipy import sparse
+except (ImportError, IOError) as err:  # pragma: no cover
+    np = sparse = None
+    _logger.debug(err)
+
+# Number of (customer, product) pairs read at once from the database
+FETCH_SIZE = 100000
+# Number of products whose similarities are computed at once
+BLOCK_SIZE = 1000
+
+
+class SaleOrderRecommendationNeighbour(models.Model):
+    """Products bought by the same customers
+
+    For each product, its most similar products, by cosine similarity of
+    the customers who bought them. Built offline from the statistics of
+    the delivered products of all the customers.
+    """
+
+    _name = "sale.order.recommendation.neighbour"
+    _description = "Products bought by the same customers"
+    _log_access = False
+    _order = "product_id, score desc"
+
+    product_id = fields.Many2one(
+        "product.product", required=True, index=True, ondelete="cascade"
+    )
+    neighbour_id = fields.Many2one("product.product", required=True, ondelete="cascade")
+    score = fields.Float(help="Cosine similarity of the customers of the products.")
+
+    @api.model
+    def _get_neighbour_count(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("sale_order_product_recommendation.neighbour_count", 20))
+
+    @api.model
+    def _read_customer_products(self):
+        """Return the arrays of customers and products they bought"""
+        self.env["sale.order.recommendation.stat"].refresh_outdated()
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT commercial_partner_id, product_id
+            FROM sale_order_recommendation_stat
+            """
+        )
+        partner_ids, product_ids = [], []
+        rows = self.env.cr.fetchmany(FETCH_SIZE)
+        while rows:
+            partner_ids.extend(row[0] for row in rows)
+            product_ids.extend(row[1] for row in rows)
+            rows = self.env.cr.fetchmany(FETCH_SIZE)
+        return (
+            np.array(partner_ids, dtype=np.int64),
+            np.array(product_ids, dtype=np.int64),
+        )
+
+    @api.model
+    def _compute_neighbours(self, partner_ids, product_ids, neighbour_count):
+        """Compute the most similar products of each product
+
+        The similarity of two products is the cosine similarity of their
+        vectors of customers, computed on a sparse customers x products
+        matrix. The similarities are computed by blocks of products, so
+        that the products x products matrix is never built whole. Return
+        the arrays of products, neighbours and scores.
+        """
+        products, product_index = np.unique(product_ids, return_inverse=True)
+        __, partner_index = np.unique(partner_ids, return_inverse=True)
+        values = np.ones(len(product_index), dtype=np.float32)
+        matrix = sparse.csr_matrix((values, (partner_index, product_index)))
+        product_matrix = matrix.T.tocsr()
+        norms = np.sqrt(
+            np.asarray(product_matrix.multiply(product_matrix).sum(axis=1)).ravel()
+        )
+        result_products, result_neighbours, result_scores = [], [], []
+        for block_start in range(0, len(products), BLOCK_SIZE):
+            block = (
+                product_matrix[block_start : block_start + BLOCK_SIZE] @ matrix
+            ).tocsr()
+            # cosine similarity: divide each value by the norms of its row
+            # and of its column
+            rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+            block.data /= norms[rows + block_start] * norms[block.indices]
+            for row in range(block.shape[0]):
+                start, end = block.indptr[row], block.indptr[row + 1]
+                scores = block.data[start:end]
+                columns = block.indices[start:end]
+                # a product is not its own neighbour
+                other = columns != block_start + row
+                scores, columns = scores[other], columns[other]
+                if not len(columns):
+                    continue
+                if len(columns) > neighbour_count:
+                    best = np.argpartition(-scores, neighbour_count)[:neighbour_count]
+                    scores, columns = scores[best], columns[best]
+                result_products.append(
+                    np.full(len(columns), products[block_start + row])
+                )
+                result_neighbours.append(products[columns])
+                result_scores.append(scores)
+        if not result_products:
+            return [], [], []
+        return (
+            np.concatenate(result_products),
+            np.concatenate(result_neighbours),
+            np.concatenate(result_scores),
+        )
+
+    @api.model
+    def build_neighbours(self):
+        """Build the table of the most similar products of each product
+
+        Must be called from ir.cron
+        """
+        if np is None or sparse is None:
+            raise UserError(_("The python libraries numpy and scipy are required."))
+        start = time.perf_counter()
+        partner_ids, product_ids = self._read_customer_products()
+        products, neighbours, scores = self._compute_neighbours(
+            partner_ids, product_ids, self._get_neighbour_count()
+        )
+        self.flush()
+        self.env.cr.execute("DELETE FROM sale_order_recommendation_neighbour")
+        for index in range(0, len(products), FETCH_SIZE):
+            chunk = slice(index, index + FETCH_SIZE)
+            self.env.cr.execute(
+                """
+                INSERT INTO sale_order_recommendation_neighbour (
+                    product_id, neighbour_id, score
+                )
+                SELECT * FROM unnest(%s::int[], %s::int[], %s::float8[])
+                """,
+                (
+                    [int(value) for value in products[chunk]],
+                    [int(value) for value in neighbours[chunk]],
+                    [float(value) for value in scores[chunk]],
+                ),
+            )
+        self.invalidate_cache()
+        _logger.info(
+            "%s similar products computed from %s customer products in %.2fs",
+            len(products),
+            len(product_ids),
+            time.perf_counter() - start,
+        )
+        return True
+
+    @api.model
+    def _get_similar_products(self, product_weights, exclude_product_ids):
+        """Return the products similar to weighted products
+
+        The score of a similar product is the sum of its similarity with
+        each product, multiplied by the weight of the product. Return a
+        list of (product id, score), best score first, among the products
+        of the allowed companies the user can read.
+        """
+        if not product_weights:
+            return []
+        self.flush()
+        product_obj = self.env["product.product"]
+        domain = [
+            ("sale_ok", "=", True),
+            ("company_id", "in", [False] + self.env.companies.ids),
+        ]
+        product_obj._flush_search(domain)
+        query = product_obj._where_calc(domain)
+        product_obj._apply_ir_rules(query, "read")
+        from_clause, where_clause, where_params = query.get_sql()
+        self.env.cr.execute(
+            """
+            SELECT n.product_id, n.neighbour_id, n.score
+            FROM sale_order_recommendation_neighbour n
+            WHERE n.product_id IN %s AND n.neighbour_id IN (
+                SELECT product_product.id FROM {} WHERE {}
+            )
+            """.format(
+                from_clause, where_clause
+            ),
+            [tuple(product_weights)] + where_params,
+        )
+        scores = {}
+        for product_id, neighbour_id, score in self.env.cr.fetchall():
+            if neighbour_id in exclude_product_ids:
+                continue
+            scores[neighbour_id] = (
+                scores.get(neighbour_id, 0.0) + score * product_weights[product_id]
+            )
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,62 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+
+class SaleOrderRecommendationOutdated(models.Model):
+    """Customers whose statistics of delivered products are outdated
+
+    A row is inserted when the delivered lines of a commercial entity
+    change, rather than flagging the partner, whose row would stay locked
+    until the end of the transaction. The rows are deleted when the
+    statistics are computed again.
+    """
+
+    _name = "sale.order.recommendation.outdated"
+    _description = "Customers with outdated sale recommendation statistics"
+    _log_access = False
+
+    commercial_partner_id = fields.Many2one(
+        "res.partner", required=True, index=True, ondelete="cascade"
+    )
+
+    @api.model
+    def _mark_outdated(self, partners_query, params):
+        """Mark the commercial partners selected by a SQL query as outdated
+
+        The partners already marked, in this transaction or a committed
+        one, are not inserted again.
+        """
+        self.env.cr.execute(
+            """
+            INSERT INTO sale_order_recommendation_outdated (commercial_partner_id)
+            SELECT DISTINCT partner.id FROM ({}) AS partner (id)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM sale_order_recommendation_outdated outdated
+                WHERE outdated.commercial_partner_id = partner.id
+            )
+            """.format(
+                partners_query
+            ),
+            params,
+        )
+
+    @api.model
+    def _get_outdated_partner_ids(self, commercial_partner_ids=None):
+        """Return the ids of the outdated commercial partners, among the
+        given ones if any
+        """
+        self.flush()
+        if commercial_partner_ids is None:
+            self.env.cr.execute(
+                "SELECT DISTINCT commercial_partner_id "
+                "FROM sale_order_recommendation_outdated"
+            )
+        else:
+            self.env.cr.execute(
+                "SELECT DISTINCT commercial_partner_id "
+                "FROM sale_order_recommendation_outdated "
+                "WHERE commercial_partner_id IN %s",
+                (tuple(commercial_partner_ids) or (None,),),
+            )
+        return [row[0] for row in self.env.cr.fetchall()]
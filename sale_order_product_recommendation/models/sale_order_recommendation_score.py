@@ -0,0 +1,140 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import threading
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleOrderRecommendationScore(models.Model):
+    """Freshness of the products delivered to a customer
+
+    Precomputed every night from the sales order lines, for the
+    recommendation wizard. Each delivery weighs less as it gets older,
+    and the interval between the orders of a product gives the date it
+    should be ordered again.
+    """
+
+    _name = "sale.order.recommendation.score"
+    _description = "Freshness of the products delivered to a customer"
+    _log_access = False
+
+    commercial_partner_id = fields.Many2one(
+        "res.partner", required=True, index=True, ondelete="cascade"
+    )
+    product_id = fields.Many2one("product.product", required=True, ondelete="cascade")
+    score = fields.Float(
+        help="Number of times the product was delivered, each delivery "
+        "weighing half as much every half-life."
+    )
+    order_count = fields.Integer()
+    last_order_date = fields.Datetime()
+    reorder_days = fields.Float(
+        help="Average number of days between two orders of the product."
+    )
+    next_order_date = fields.Datetime(
+        help="Date the product is expected to be ordered again."
+    )
+
+    _sql_constraints = [
+        (
+            "partner_product_uniq",
+            "unique(commercial_partner_id, product_id)",
+            "The score of a product by customer must be unique.",
+        )
+    ]
+
+    @api.model
+    def _get_half_life(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return float(get_param("sale_order_product_recommendation.half_life", 90))
+
+    @api.model
+    def _compute_scores(self, commercial_partner_ids):
+        """Compute again the scores of the commercial partners"""
+        if not commercial_partner_ids:
+            return
+        self.flush()
+        ids = tuple(commercial_partner_ids)
+        self.env.cr.execute(
+            "DELETE FROM sale_order_recommendation_score "
+            "WHERE commercial_partner_id IN %s",
+            (ids,),
+        )
+        self.env.cr.execute(
+            """
+            WITH delivery AS (
+                SELECT rp.commercial_partner_id, sol.product_id, so.id AS order_id,
+                    so.date_order,
+                    greatest(extract(epoch FROM %(now)s - so.date_order), 0)
+                        / 86400 AS age
+                FROM sale_order_line sol
+                JOIN sale_order so ON so.id = sol.order_id
+                JOIN res_partner rp ON rp.id = so.partner_id
+                WHERE rp.commercial_partner_id IN %(ids)s
+                    AND sol.product_id IS NOT NULL
+                    AND sol.qty_delivered != 0
+            ), product AS (
+                SELECT commercial_partner_id, product_id,
+                    sum(power(0.5, age / %(half_life)s)) AS score,
+                    count(DISTINCT order_id) AS order_count,
+                    max(date_order) AS last_order_date,
+                    CASE WHEN count(DISTINCT order_id) > 1 THEN
+                        extract(epoch FROM max(date_order) - min(date_order))
+                            / 86400 / (count(DISTINCT order_id) - 1)
+                    END::float8 AS reorder_days
+                FROM delivery
+                GROUP BY commercial_partner_id, product_id
+            )
+            INSERT INTO sale_order_recommendation_score (
+                commercial_partner_id, product_id, score, order_count,
+                last_order_date, reorder_days, next_order_date
+            )
+            SELECT commercial_partner_id, product_id, score, order_count,
+                last_order_date, reorder_days,
+                last_order_date + reorder_days * interval '1 day'
+            FROM product
+            """,
+            {
+                "ids": ids,
+                "now": fields.Datetime.now(),
+                "half_life": self._get_half_life(),
+            },
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def compute_all_scores(self):
+        """Compute again the scores of all the customers, by committed batches
+
+        Must be called from ir.cron, every night as the scores depend on the
+        current date.
+        """
+        self.flush()
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT rp.commercial_partner_id
+            FROM sale_order so
+            JOIN res_partner rp ON rp.id = so.partner_id
+            """
+        )
+        partner_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.env.cr.execute(
+            "DELETE FROM sale_order_recommendation_score "
+            "WHERE commercial_partner_id != ALL(%s)",
+            (partner_ids,),
+        )
+        batch_size = self.env[
+            "sale.order.recommendation.stat"
+        ]._get_refresh_batch_size()
+        for batch_ids in split_every(batch_size, partner_ids):
+            self._compute_scores(batch_ids)
+            if not getattr(threading.currentThread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+        _logger.info(
+            "Sale recommendation scores computed for %s customers", len(partner_ids)
+        )
+        return True
@@ -0,0 +1,217 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import threading
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleOrderRecommendationStat(models.Model):
+    """Delivered products by customer, company and month
+
+    Precomputed from the sales order lines, for the recommendation wizard.
+    The statistics of a customer are computed again when its commercial
+    entity is marked as outdated by a change on its delivered lines.
+    """
+
+    _name = "sale.order.recommendation.stat"
+    _description = "Delivered products by customer, company and month"
+    _log_access = False
+
+    commercial_partner_id = fields.Many2one(
+        "res.partner", required=True, index=True, ondelete="cascade"
+    )
+    company_id = fields.Many2one("res.company", required=True, ondelete="cascade")
+    product_id = fields.Many2one("product.product", required=True, ondelete="cascade")
+    month = fields.Date(required=True, help="First day of the month of the orders.")
+    times_delivered = fields.Integer()
+    units_delivered = fields.Float()
+    last_order_date = fields.Datetime()
+
+    _sql_constraints = [
+        (
+            "partner_company_product_month_uniq",
+            "unique(commercial_partner_id, company_id, product_id, month)",
+            "The statistics of a product by customer, company and month must "
+            "be unique.",
+        )
+    ]
+
+    @api.model
+    def _refresh(self, commercial_partner_ids):
+        """Compute again the statistics of the commercial partners"""
+        if not commercial_partner_ids:
+            return
+        self.flush()
+        ids = tuple(commercial_partner_ids)
+        self.env.cr.execute(
+            "DELETE FROM sale_order_recommendation_stat "
+            "WHERE commercial_partner_id IN %s",
+            (ids,),
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO sale_order_recommendation_stat (
+                commercial_partner_id, company_id, product_id, month,
+                times_delivered, units_delivered, last_order_date
+            )
+            SELECT rp.commercial_partner_id, so.company_id, sol.product_id,
+                date_trunc('month', so.date_order)::date,
+                count(*), sum(sol.qty_delivered), max(so.date_order)
+            FROM sale_order_line sol
+            JOIN sale_order so ON so.id = sol.order_id
+            JOIN res_partner rp ON rp.id = so.partner_id
+            WHERE rp.commercial_partner_id IN %s
+                AND sol.product_id IS NOT NULL
+                AND sol.qty_delivered != 0
+            GROUP BY 1, 2, 3, 4
+            """,
+            (ids,),
+        )
+        self.env.cr.execute(
+            "DELETE FROM sale_order_recommendation_outdated "
+            "WHERE commercial_partner_id IN %s",
+            (ids,),
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _get_refresh_batch_size(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("sale_order_product_recommendation.batch_size", 1000))
+
+    @api.model
+    def refresh_outdated(self):
+        """Compute again the outdated statistics, by committed batches
+
+        Must be called from ir.cron
+        """
+        partner_ids = self.env[
+            "sale.order.recommendation.outdated"
+        ]._get_outdated_partner_ids()
+        for batch_ids in split_every(self._get_refresh_batch_size(), partner_ids):
+            self._refresh(batch_ids)
+            if not getattr(threading.currentThread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+        _logger.info(
+            "Sale recommendation statistics refreshed for %s customers",
+            len(partner_ids),
+        )
+        return True
+
+    @api.model
+    def _has_hidden_lines(self, commercial_partner, company):
+        """Return whether the record rules hide delivered lines of the
+        customer in the company to the user, which the statistics count
+        """
+        if self.env.su:
+            return False
+        domain = [
+            ("order_partner_id", "child_of", commercial_partner.id),
+            ("company_id", "=", company.id),
+            ("qty_delivered", "!=", 0.0),
+        ]
+        so_line_obj = self.env["sale.order.line"]
+        return so_line_obj.search_count(domain) != so_line_obj.sudo().search_count(
+            domain
+        )
+
+    @api.model
+    def _read_stats(
+        self,
+        commercial_partner,
+        start,
+        company=None,
+        limit=None,
+        product_ids=None,
+        exclude_product_ids=None,
+        deduct=None,
+        ranking="delivered",
+    ):
+        """Return the delivered products of the customer since the month of
+        start
+
+        Return a list of dicts like the ones of a ``read_group`` on the
+        sales order lines, grouped by product, most delivered first.
+
+        :param company: only count the orders of this company, the current
+            one by default, nothing is returned if the user is not allowed
+            to work in it
+        :param limit: maximum number of products to return
+        :param product_ids: only return these products
+        :param exclude_product_ids: don't return these products
+        :param deduct: dict of the ``(times, units)`` delivered by product
+            to deduct from the statistics, like the ones of the current order
+        :param ranking: ``delivered`` to return the most delivered products
+            first, ``score`` to return the ones with the best precomputed
+            freshness score first
+        """
+        company = company or self.env.company
+        if not self.env.su and company not in self.env.companies:
+            return []
+        outdated_obj = self.env["sale.order.recommendation.outdated"]
+        if outdated_obj._get_outdated_partner_ids(commercial_partner.ids):
+            self._refresh(commercial_partner.ids)
+        deduct = deduct or {}
+        params = {
+            "commercial_partner_id": commercial_partner.id,
+            "company_id": company.id,
+            "start": start,
+            "limit": limit,
+            "deduct_product_ids": list(deduct),
+            "deduct_times": [times for times, __ in deduct.values()],
+            "deduct_units": [units for __, units in deduct.values()],
+            "product_ids": None if product_ids is None else list(product_ids),
+            "exclude_product_ids": list(exclude_product_ids or []),
+            "by_score": ranking == "score",
+        }
+        self.env.cr.execute(
+            """
+            WITH deduct (product_id, times_delivered, units_delivered) AS (
+                SELECT * FROM unnest(
+                    %(deduct_product_ids)s::int[],
+                    %(deduct_times)s::int[],
+                    %(deduct_units)s::float8[]
+                )
+            )
+            SELECT stat.product_id,
+                sum(stat.times_delivered) - coalesce(max(deduct.times_delivered), 0),
+                sum(stat.units_delivered) - coalesce(max(deduct.units_delivered), 0),
+                coalesce(max(score.score), 0),
+                coalesce(max(score.next_order_date) <= now() at time zone 'UTC', false)
+            FROM sale_order_recommendation_stat stat
+            JOIN product_product pp ON pp.id = stat.product_id
+            JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            LEFT JOIN deduct ON deduct.product_id = stat.product_id
+            LEFT JOIN sale_order_recommendation_score score
+                ON score.commercial_partner_id = stat.commercial_partner_id
+                AND score.product_id = stat.product_id
+            WHERE stat.commercial_partner_id = %(commercial_partner_id)s
+                AND stat.company_id = %(company_id)s
+                AND stat.month >= date_trunc('month', %(start)s::timestamp)::date
+                AND pp.active AND pt.sale_ok
+                AND (%(product_ids)s::int[] IS NULL
+                    OR stat.product_id = ANY(%(product_ids)s::int[]))
+                AND stat.product_id != ALL(%(exclude_product_ids)s::int[])
+            GROUP BY stat.product_id
+            HAVING sum(stat.times_delivered)
+                > coalesce(max(deduct.times_delivered), 0)
+            ORDER BY CASE WHEN %(by_score)s THEN max(score.score) END
+                DESC NULLS LAST, 2 DESC, 3 DESC, stat.product_id
+            LIMIT %(limit)s
+            """,
+            params,
+        )
+        return [
+            {
+                "product_id": (product_id, False),
+                "product_id_count": count,
+                "qty_delivered": qty,
+                "score": score,
+                "reorder_due": reorder_due,
+            }
+            for product_id, count, qty, score, reorder_due in self.env.cr.fetchall()
+        ]
@@ -1,10 +1,22 @@
 # Copyright 2017 Tecnativa - Jairo Llopis
 # Copyright 2020 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import unittest
+from datetime import timedelta
+
+import mock
+
+from odoo import fields
 from odoo.exceptions import UserError
+from odoo.tests import Form
 
 from .test_recommendation_common import RecommendationCase
 
+try:
+    from scipy import sparse
+except ImportError:  # pragma: no cover
+    sparse = None
+
 
 class RecommendationCaseTests(RecommendationCase):
     def test_recommendations(self):
@@ -92,3 +104,358 @@ class RecommendationCaseTests(RecommendationCase):
         line = self.new_so.order_line.filtered(lambda x: x.product_id == self.prod_1)
         self.assertTrue(line)
         self.assertEqual(line.product_uom_qty, qty)
+
+    def test_recommendations_record_rules(self):
+        """The orders hidden by the record rules are not recommended."""
+        salesman = self.env["res.users"].create(
+            {
+                "name": "Own documents salesman",
+                "login": "own_documents_salesman",
+                "groups_id": [
+                    (4, self.env.ref("sales_team.group_sale_salesman").id),
+                    (4, self.env.ref("uom.group_uom").id),
+                ],
+            }
+        )
+        orders = self.env["sale.order"].search(
+            [("partner_id", "=", self.partner.id), ("state", "=", "done")]
+        )
+        orders.filtered(lambda order: len(order.order_line) == 1).user_id = salesman
+        self.new_so.user_id = salesman
+        wizard = (
+            self.env["sale.order.recommendation"]
+            .with_user(salesman)
+            .with_context(active_id=self.new_so.id)
+            .create({})
+        )
+        wizard._generate_recommendations()
+        self.assertEqual(wizard.line_ids.mapped("product_id"), self.prod_2)
+        self.assertEqual(wizard.line_ids.times_delivered, 1)
+        self.assertEqual(wizard.line_ids.units_delivered, 50)
+
+    def test_recommendation_stats(self):
+        """Statistics are computed again when the deliveries change."""
+        stat_obj = self.env["sale.order.recommendation.stat"]
+        outdated_obj = self.env["sale.order.recommendation.outdated"]
+        self.wizard()
+        self.assertFalse(outdated_obj._get_outdated_partner_ids(self.partner.ids))
+        stats = stat_obj.search([("commercial_partner_id", "=", self.partner.id)])
+        self.assertEqual(sum(stats.mapped("times_delivered")), 4)
+        self.assertEqual(sum(stats.mapped("units_delivered")), 225)
+        contact = self.env["res.partner"].create(
+            {"name": "Contact", "parent_id": self.partner.id}
+        )
+        order = self.env["sale.order"].create(
+            {
+                "partner_id": contact.id,
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.prod_3.id,
+                            "name": self.prod_3.name,
+                            "product_uom_qty": 5,
+                            "qty_delivered_method": "manual",
+                        },
+                    )
+                ],
+            }
+        )
+        order.flush()
+        # Nothing delivered yet
+        self.assertFalse(outdated_obj._get_outdated_partner_ids(self.partner.ids))
+        order.order_line.qty_delivered = 5
+        order.flush()
+        self.assertEqual(
+            outdated_obj._get_outdated_partner_ids(self.partner.ids), self.partner.ids
+        )
+        # the partner is marked once
+        order.order_line.qty_delivered = 6
+        order.flush()
+        self.assertEqual(
+            outdated_obj.search_count(
+                [("commercial_partner_id", "=", self.partner.id)]
+            ),
+            1,
+        )
+        stat_obj.refresh_outdated()
+        self.assertFalse(outdated_obj._get_outdated_partner_ids(self.partner.ids))
+        wizard = self.wizard()
+        wiz_line_prod3 = wizard.line_ids.filtered(lambda x: x.product_id == self.prod_3)
+        self.assertEqual(wiz_line_prod3.times_delivered, 2)
+        self.assertEqual(wiz_line_prod3.units_delivered, 106)
+        # the statistics are by company
+        other_company = self.env["res.company"].create({"name": "Other company"})
+        start = wizard._get_start_date()
+        self.assertTrue(stat_obj._read_stats(self.partner, start))
+        self.assertFalse(stat_obj._read_stats(self.partner, start, other_company))
+
+    @unittest.skipIf(sparse is None, "numpy and scipy are not installed")
+    def test_recommendations_similar_products(self):
+        """Products bought by other customers of the same products."""
+        prod_4 = self.product_obj.create({"name": "Test Product 4", "type": "service"})
+        other_partner = self.env["res.partner"].create({"name": "Mrs. Odoo"})
+        self.env["sale.order"].create(
+            {
+                "partner_id": other_partner.id,
+                "state": "done",
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": product.id,
+                            "name": product.name,
+                            "product_uom_qty": 5,
+                            "qty_delivered_method": "manual",
+                            "qty_delivered": 5,
+                        },
+                    )
+                    for product in (self.prod_2, prod_4)
+                ],
+            }
+        )
+        neighbour_obj = self.env["sale.order.recommendation.neighbour"]
+        neighbour_obj.build_neighbours()
+        neighbours = neighbour_obj.search([("product_id", "=", prod_4.id)])
+        self.assertEqual(neighbours.neighbour_id, self.prod_2)
+        self.assertAlmostEqual(neighbours.score, 0.5 ** 0.5, places=5)
+        wizard = self.wizard()
+        wiz_line_prod4 = wizard.line_ids.filtered(lambda x: x.product_id == prod_4)
+        self.assertEqual(wiz_line_prod4.times_delivered, 0)
+        self.assertAlmostEqual(wiz_line_prod4.similarity, 2 * 0.5 ** 0.5, places=5)
+        # Not recommended without weight
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_order_product_recommendation.similar_weight", "0"
+        )
+        wizard = self.wizard()
+        self.assertNotIn(prod_4, wizard.line_ids.mapped("product_id"))
+
+    def test_similar_products_company(self):
+        """Only the similar products of the allowed companies are returned."""
+        other_company = self.env["res.company"].create({"name": "Other company"})
+        other_product = self.product_obj.create(
+            {"name": "Other company product", "company_id": other_company.id}
+        )
+        neighbour_obj = self.env["sale.order.recommendation.neighbour"]
+        neighbour_obj.create(
+            [
+                {"product_id": self.prod_1.id, "neighbour_id": product.id, "score": 0.5}
+                for product in (self.prod_2, other_product)
+            ]
+        )
+        self.assertEqual(
+            neighbour_obj._get_similar_products({self.prod_1.id: 2}, set()),
+            [(self.prod_2.id, 1.0)],
+        )
+        neighbour_obj = neighbour_obj.with_context(
+            allowed_company_ids=(self.env.company + other_company).ids
+        )
+        self.assertEqual(
+            len(neighbour_obj._get_similar_products({self.prod_1.id: 2}, set())), 2
+        )
+
+    def _accept_recommendations(self, order, through_form=False):
+        """Add 5 units of all the recommended products to the order, or
+        the same changes through the order form"""
+        wizard = (
+            self.env["sale.order.recommendation"]
+            .with_context(active_id=order.id)
+            .create({})
+        )
+        wizard._generate_recommendations()
+        for wiz_line in wizard.line_ids:
+            wiz_line.units_included += 5
+        if through_form:
+            sequence = max(order.mapped("order_line.sequence") or [0])
+            with Form(order) as order_form:
+                for wiz_line in wizard.line_ids:
+                    if wiz_line.sale_line_id:
+                        index = order.order_line.ids.index(wiz_line.sale_line_id.id)
+                        with order_form.order_line.edit(index) as line_form:
+                            wiz_line._prepare_update_so_line(line_form)
+                    else:
+                        sequence += 1
+                        with order_form.order_line.new() as line_form:
+                            wiz_line._prepare_new_so_line(line_form, sequence)
+        else:
+            wizard.action_accept()
+        fnames = [
+            "product_id",
+            "name",
+            "sequence",
+            "product_uom_qty",
+            "product_uom",
+            "price_unit",
+            "discount",
+            "tax_id",
+            "price_subtotal",
+        ]
+        return [
+            {fname: line[fname] for fname in fnames}
+            for line in order.order_line.sorted("sequence")
+        ]
+
+    def test_accept_form_parity(self):
+        """Accepting gives the same lines as through the order form."""
+        self.prod_2.list_price = 20
+        pricelist = self.env["product.pricelist"].create(
+            {
+                "name": "Test pricelist",
+                "item_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "applied_on": "0_product_variant",
+                            "product_id": self.prod_2.id,
+                            "min_quantity": 10,
+                            "compute_price": "fixed",
+                            "fixed_price": 15,
+                        },
+                    )
+                ],
+            }
+        )
+        orders = self.env["sale.order"].create(
+            [
+                {
+                    "partner_id": self.partner.id,
+                    "pricelist_id": pricelist.id,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "product_id": self.prod_2.id,
+                                "name": self.prod_2.name,
+                                "product_uom_qty": 6,
+                                "price_unit": 20,
+                            },
+                        )
+                    ],
+                }
+                for __ in range(2)
+            ]
+        )
+        lines_form = self._accept_recommendations(orders[0], through_form=True)
+        lines_bulk = self._accept_recommendations(orders[1])
+        self.assertEqual(len(lines_bulk), 3)
+        self.assertEqual(lines_bulk, lines_form)
+        # 11 units of product 2 get the pricelist price
+        line_prod2 = orders[1].order_line.filtered(
+            lambda x: x.product_id == self.prod_2
+        )
+        self.assertEqual(line_prod2.product_uom_qty, 11)
+        self.assertEqual(line_prod2.price_unit, 15)
+
+    def test_recommendation_prices(self):
+        """Lines are priced once per pricelist and partner."""
+        wizard = self.wizard()
+        for wiz_line in wizard.line_ids:
+            self.assertEqual(
+                wiz_line.price_unit,
+                wiz_line.product_id.with_context(
+                    partner=self.partner.id,
+                    pricelist=self.new_so.pricelist_id.id,
+                    quantity=wiz_line.units_included,
+                ).price,
+            )
+        pricelist_model = type(self.env["product.pricelist"])
+        with mock.patch.object(
+            pricelist_model,
+            "_compute_price_rule",
+            autospec=True,
+            side_effect=pricelist_model._compute_price_rule,
+        ) as mocked:
+            wizard.line_ids.invalidate_cache(["price_unit"])
+            wizard.line_ids.mapped("price_unit")
+            # The prices are cached for the life of the wizard
+            mocked.assert_not_called()
+            wizard.line_ids.write({"units_included": 3})
+            wizard.line_ids.mapped("price_unit")
+            mocked.assert_called_once()
+
+    def test_recommendations_load_more(self):
+        """More recommendations are loaded on demand."""
+        wizard = self.wizard()
+        wizard.line_amount = 1
+        wizard._generate_recommendations()
+        self.assertEqual(wizard.line_ids.mapped("product_id"), self.prod_2)
+        wizard.action_load_more()
+        self.assertEqual(
+            wizard.line_ids.mapped("product_id"), self.prod_2 + self.prod_3
+        )
+        self.assertEqual(wizard.line_ids[1].times_delivered, 1)
+        self.assertEqual(wizard.line_ids[1].units_delivered, 100)
+        wizard.action_load_more()
+        wizard.action_load_more()
+        self.assertEqual(
+            wizard.line_ids.mapped("product_id"),
+            self.prod_2 + self.prod_3 + self.prod_1,
+        )
+
+    def test_recommendation_scores(self):
+        """Recent deliveries weigh more and due products are flagged."""
+        now = fields.Datetime.now()
+        old_orders = self.env["sale.order"].search(
+            [("partner_id", "=", self.partner.id), ("state", "=", "done")], order="id",
+        )
+        old_orders[0].date_order = now - timedelta(days=100)
+        old_orders[1].date_order = now - timedelta(days=170)
+        self.env["sale.order"].create(
+            {
+                "partner_id": self.partner.id,
+                "state": "done",
+                "date_order": now - timedelta(days=1),
+                "order_line": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.prod_1.id,
+                            "name": self.prod_1.name,
+                            "product_uom_qty": 1,
+                            "qty_delivered_method": "manual",
+                            "qty_delivered": 1,
+                        },
+                    )
+                ],
+            }
+        )
+        self.env["ir.config_parameter"].sudo().set_param(
+            "sale_order_product_recommendation.half_life", "30"
+        )
+        score_obj = self.env["sale.order.recommendation.score"]
+        score_obj.compute_all_scores()
+        score_prod2 = score_obj.search(
+            [
+                ("commercial_partner_id", "=", self.partner.id),
+                ("product_id", "=", self.prod_2.id),
+            ]
+        )
+        self.assertEqual(score_prod2.order_count, 2)
+        self.assertAlmostEqual(score_prod2.reorder_days, 70, places=2)
+        wizard = self.wizard()
+        self.assertEqual(
+            wizard.line_ids.mapped("product_id"),
+            self.prod_2 + self.prod_1 + self.prod_3,
+        )
+        wizard.ranking = "score"
+        wizard._generate_recommendations()
+        self.assertEqual(
+            wizard.line_ids.mapped("product_id"),
+            self.prod_1 + self.prod_2 + self.prod_3,
+        )
+        self.assertAlmostEqual(wizard.line_ids[2].score, 0.5 ** (100 / 30), places=2)
+        # Product 2 is ordered every 70 days, the last time 100 days ago
+        self.assertEqual(wizard.line_ids.filtered("reorder_due"), wizard.line_ids[1])
+        # Delivered products without score yet are ranked too
+        score_obj.search([]).unlink()
+        found_lines = wizard._get_delivered_products()
+        self.assertEqual(len(found_lines), 3)
+        self.assertEqual(
+            [wizard._get_rank_key(line) for line in found_lines],
+            [(0.0, line["qty_delivered"]) for line in found_lines],
+        )
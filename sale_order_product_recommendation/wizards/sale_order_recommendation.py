@@ -3,10 +3,18 @@
 # Copyright 2020 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 from odoo import api, fields, models
-from odoo.tests import Form
+from odoo.tools.lru import LRU
+
+_logger = logging.getLogger(__name__)
+
+# Unit prices of the recommendation lines by wizard, pricelist and partner
+PRICE_CACHE = LRU(512)
 
 
 class SaleOrderRecommendation(models.TransientModel):
@@ -24,7 +32,8 @@ class SaleOrderRecommendation(models.TransientModel):
     months = fields.Float(
         default=6,
         required=True,
-        help="Consider these months backwards to generate recommendations.",
+        help="Consider these months backwards to generate recommendations. "
+        "The month of the start date is considered entirely.",
     )
     line_ids = fields.One2many(
         "sale.order.recommendation.line", "wizard_id", "Products"
@@ -35,16 +44,35 @@ class SaleOrderRecommendation(models.TransientModel):
         required=True,
         help="The less, the faster they will be found.",
     )
+    ranking = fields.Selection(
+        [("delivered", "Most delivered"), ("score", "Recently delivered")],
+        default="delivered",
+        required=True,
+        help="Most delivered: the products delivered more times in the "
+        "considered months first.\n"
+        "Recently delivered: the products with the best freshness score "
+        "first, computed every night, where recent deliveries weigh more.",
+    )
     last_compute = fields.Char()
+    price_cache_key = fields.Char(
+        default=lambda self: uuid4().hex,
+        help="Identifies the prices computed for the lines of this wizard.",
+    )
 
     @api.model
     def _default_order_id(self):
         return self.env.context.get("active_id", False)
 
+    def _get_start_date(self):
+        return datetime.now() - timedelta(days=self.months * 30)
+
     def _recomendable_sale_order_lines_domain(self):
-        """Domain to find recent SO lines."""
-        start = datetime.now() - timedelta(days=self.months * 30)
-        start = fields.Datetime.to_string(start)
+        """Domain to find recent SO lines.
+
+        Only used when the lines are read instead of the precomputed
+        statistics, see ``_use_delivered_stats``.
+        """
+        start = fields.Datetime.to_string(self._get_start_date())
         other_sales = self.env["sale.order"].search(
             [
                 (
@@ -52,6 +80,7 @@ class SaleOrderRecommendation(models.TransientModel):
                     "child_of",
                     self.order_id.partner_id.commercial_partner_id.id,
                 ),
+                ("company_id", "=", self.order_id.company_id.id),
                 ("date_order", ">=", start),
             ]
         )
@@ -62,6 +91,150 @@ class SaleOrderRecommendation(models.TransientModel):
             ("qty_delivered", "!=", 0.0),
         ]
 
+    def _use_delivered_stats(self):
+        """Return whether the delivered products are read from the statistics
+
+        The statistics count all the orders of the customer in the company
+        of the order. When the record rules hide some of them to the user,
+        the lines are read instead, with the domain returned by
+        ``_recomendable_sale_order_lines_domain``: modules overriding it to
+        filter the lines must also return False here.
+        """
+        return not self.env["sale.order.recommendation.stat"]._has_hidden_lines(
+            self.order_id.partner_id.commercial_partner_id, self.order_id.company_id
+        )
+
+    def _read_delivered_lines(
+        self, limit=None, product_ids=None, exclude_product_ids=None
+    ):
+        """Return the products delivered to the customer, read from the
+        lines the user can read, like ``_get_delivered_products``
+        """
+        domain = self._recomendable_sale_order_lines_domain()
+        if product_ids is not None:
+            domain += [("product_id", "in", list(product_ids))]
+        if exclude_product_ids:
+            domain += [("product_id", "not in", list(exclude_product_ids))]
+        found_lines = self.env["sale.order.line"].read_group(
+            domain, ["product_id", "qty_delivered"], ["product_id"]
+        )
+        if self.ranking == "score":
+            scores = self.env["sale.order.recommendation.score"].search(
+                [
+                    (
+                        "commercial_partner_id",
+                        "=",
+                        self.order_id.partner_id.commercial_partner_id.id,
+                    ),
+                    (
+                        "product_id",
+                        "in",
+                        [line["product_id"][0] for line in found_lines],
+                    ),
+                ]
+            )
+            now = fields.Datetime.now()
+            score_dict = {score.product_id.id: score for score in scores}
+            for line in found_lines:
+                score = score_dict.get(line["product_id"][0])
+                if score:
+                    line["score"] = score.score
+                    line["reorder_due"] = bool(
+                        score.next_order_date and score.next_order_date <= now
+                    )
+        found_lines = sorted(found_lines, key=self._get_rank_key, reverse=True)
+        return found_lines[:limit] if limit else found_lines
+
+    def _get_delivered_products(
+        self, limit=None, product_ids=None, exclude_product_ids=None
+    ):
+        """Return the products delivered to the customer in previous months
+
+        Read from the precomputed statistics, by months, so the months of
+        the start date and of the order are considered entirely. Return a
+        list of dicts like the ones of a ``read_group`` on the lines, most
+        delivered first, without the lines of the current order.
+        """
+        commercial_partner = self.order_id.partner_id.commercial_partner_id
+        if not commercial_partner:
+            return []
+        if not self._use_delivered_stats():
+            return self._read_delivered_lines(
+                limit=limit,
+                product_ids=product_ids,
+                exclude_product_ids=exclude_product_ids,
+            )
+        start = self._get_start_date()
+        deduct = {}
+        order_month = self.order_id.date_order.replace(day=1).date()
+        if order_month >= start.replace(day=1).date():
+            for line in self.order_id.order_line:
+                if not line.qty_delivered or not line.product_id:
+                    continue
+                times, units = deduct.get(line.product_id.id, (0, 0.0))
+                deduct[line.product_id.id] = (times + 1, units + line.qty_delivered)
+        return self.env["sale.order.recommendation.stat"]._read_stats(
+            commercial_partner,
+            start,
+            company=self.order_id.company_id,
+            limit=limit,
+            product_ids=product_ids,
+            exclude_product_ids=exclude_product_ids,
+            deduct=deduct,
+            ranking=self.ranking,
+        )
+
+    @api.model
+    def _get_similar_products_weight(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return float(get_param("sale_order_product_recommendation.similar_weight", 1.0))
+
+    def _add_similar_products(self, found_lines, exclude_product_ids=()):
+        """Add the products bought by customers having bought the same ones
+
+        Their score, the weighted sum of their similarity with the products
+        delivered to the customer, is compared with the number of times
+        the delivered products were delivered.
+        """
+        weight = self._get_similar_products_weight()
+        if not weight or not found_lines:
+            return found_lines
+        product_weights = {
+            line["product_id"][0]: line["product_id_count"] for line in found_lines
+        }
+        exclude_product_ids = (
+            set(product_weights)
+            | set(exclude_product_ids)
+            | set(self.order_id.order_line.mapped("product_id").ids)
+        )
+        similar_products = self.env[
+            "sale.order.recommendation.neighbour"
+        ]._get_similar_products(product_weights, exclude_product_ids)
+        if not similar_products:
+            return found_lines
+        similar_lines = [
+            {
+                "product_id": (product_id, False),
+                "product_id_count": 0,
+                "qty_delivered": 0.0,
+                "similarity": score * weight,
+            }
+            for product_id, score in similar_products
+        ]
+        return sorted(found_lines + similar_lines, key=self._get_rank_key, reverse=True)
+
+    def _get_rank_key(self, res):
+        """Sort key of a recommendation, like the ones of ``_read_stats``"""
+        if self.ranking == "score":
+            return (
+                res.get("score") or res.get("similarity", 0.0),
+                res["qty_delivered"],
+            )
+        return (
+            res["product_id_count"] or res.get("similarity", 0.0),
+            res["qty_delivered"],
+        )
+
     def _prepare_recommendation_line_vals(self, group_line, so_line=False):
         """Return the vals dictionary for creating a new recommendation line.
         @param group_line: Dictionary returned by the read_group operation.
@@ -71,82 +244,179 @@ class SaleOrderRecommendation(models.TransientModel):
             "product_id": group_line["product_id"][0],
             "times_delivered": group_line.get("product_id_count", 0),
             "units_delivered": group_line.get("qty_delivered", 0),
+            "similarity": group_line.get("similarity", 0),
+            "score": group_line.get("score", 0),
+            "reorder_due": group_line.get("reorder_due", False),
         }
         if so_line:
             vals["units_included"] = so_line.product_uom_qty
             vals["sale_line_id"] = so_line.id
         return vals
 
-    @api.onchange("order_id", "months", "line_amount")
+    @api.onchange("order_id", "months", "line_amount", "ranking")
     def _generate_recommendations(self):
         """Generate lines according to context sale order."""
         recommendation_lines = [(5,)]
-        last_compute = "{}-{}-{}".format(self.id, self.months, self.line_amount)
+        last_compute = "{}-{}-{}-{}".format(
+            self.id, self.months, self.line_amount, self.ranking
+        )
         # Avoid execute onchange as times as fields in api.onchange
         # ORM must control this?
         if self.last_compute == last_compute:
             return
         self.last_compute = last_compute
-        # Search delivered products in previous months
-        found_lines = self.env["sale.order.line"].read_group(
-            self._recomendable_sale_order_lines_domain(),
-            ["product_id", "qty_delivered"],
-            ["product_id"],
-        )
-        # Manual ordering that circumvents ORM limitations
-        found_lines = sorted(
-            found_lines,
-            key=lambda res: (res["product_id_count"], res["qty_delivered"]),
-            reverse=True,
-        )
-        found_dict = {l["product_id"][0]: l for l in found_lines}
-        existing_product_ids = set()
         # Always recommend all products already present in the linked SO
+        existing_products = self.order_id.order_line.mapped("product_id")
+        found_lines = []
+        if existing_products:
+            found_lines = self._get_delivered_products(
+                product_ids=existing_products.ids
+            )
+        found_dict = {l["product_id"][0]: l for l in found_lines}
         for line in self.order_id.order_line:
             found_line = found_dict.get(
                 line.product_id.id, {"product_id": (line.product_id.id, False)}
             )
             line_vals = self._prepare_recommendation_line_vals(found_line, line)
             recommendation_lines.append((0, 0, line_vals))
-            existing_product_ids.add(line.product_id.id)
         # Add recent SO recommendations too
-        i = 0
-        for line in found_lines:
-            if line["product_id"][0] in existing_product_ids:
-                continue
-            line_vals = self._prepare_recommendation_line_vals(line)
-            recommendation_lines.append((0, 0, line_vals))
-            # limit number of results. It has to be done here, as we need to
-            # populate all results first, for being able to select best matches
-            i += 1
-            if i >= self.line_amount:
-                break
+        recommendation_lines += self._get_next_recommendation_lines(
+            existing_products.ids
+        )
         self.line_ids = recommendation_lines
 
-    def action_accept(self):
-        """Propagate recommendations to sale order."""
+    def _get_next_recommendation_lines(self, exclude_product_ids):
+        """Return the commands to add the next ``line_amount`` recommendations
+
+        The best delivered products are read in SQL, apart from the already
+        recommended ones, so it costs the same for any customer history.
+        """
+        found_lines = self._get_delivered_products(
+            limit=self.line_amount, exclude_product_ids=exclude_product_ids
+        )
+        found_lines = self._add_similar_products(found_lines, exclude_product_ids)
+        return [
+            (0, 0, self._prepare_recommendation_line_vals(line))
+            for line in found_lines[: self.line_amount]
+        ]
+
+    def action_load_more(self):
+        """Add the next recommendations and show the wizard again"""
+        self.ensure_one()
+        exclude_product_ids = set(self.line_ids.mapped("product_id").ids) | set(
+            self.order_id.order_line.mapped("product_id").ids
+        )
+        self.line_ids = self._get_next_recommendation_lines(list(exclude_product_ids))
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+            "context": self.env.context,
+        }
+
+    @api.model
+    def _play_line_onchanges(self, line, field_names):
+        """Play the onchange methods of the fields on a new order line
+
+        As in the form view, the onchange methods of the fields they modify
+        are played too, once per field.
+        """
+        onchange_methods = line._onchange_methods
+        names = [name for name in onchange_methods if name in line._fields]
+        values = {name: line[name] for name in names}
+        todo = list(field_names)
+        done = set()
+        while todo:
+            field_name = todo.pop(0)
+            if field_name in done:
+                continue
+            done.add(field_name)
+            for method in onchange_methods.get(field_name, ()):
+                method(line)
+            new_values = {name: line[name] for name in names}
+            todo.extend(name for name in names if new_values[name] != values[name])
+            values = new_values
+
+    @api.model
+    def _update_line(self, line, vals):
+        """Set values on a new order line, as in the form view
+
+        The values are set one at a time, in order, each one followed by
+        its onchange methods.
+        """
+        for name, value in vals.items():
+            line.update({name: value})
+            self._play_line_onchanges(line, [name])
+
+    @api.model
+    def _get_line_write_vals(self, line):
+        """Return the values of an order line to write
+
+        Only the values in cache of its stored fields which are neither
+        computed nor one2many fields are returned, in the write format.
+        """
+        fields = line._fields
+        return line._convert_to_write(
+            {
+                name: line[name]
+                for name in list(line._cache)
+                if name != "id"
+                and fields[name].store
+                and not fields[name].compute
+                and fields[name].type != "one2many"
+            }
+        )
+
+    def _prepare_so_line_commands(self):
+        """Return the commands to write on the order lines
+
+        The onchanges of the modified and new lines are played on new
+        records, without the rest of the order.
+        """
+        line_obj = self.env["sale.order.line"].sudo()
+        defaults = line_obj.default_get(list(line_obj._fields))
         sequence = max(self.order_id.mapped("order_line.sequence") or [0])
-        order_form = Form(self.order_id.sudo())
-        to_remove = []
+        commands = []
         for wiz_line in self.line_ids.filtered(
             lambda x: x.sale_line_id or x.units_included
         ):
-            if wiz_line.sale_line_id:
-                index = self.order_id.order_line.ids.index(wiz_line.sale_line_id.id)
-                if wiz_line.units_included:
-                    with order_form.order_line.edit(index) as line_form:
-                        wiz_line._prepare_update_so_line(line_form)
-                else:
-                    to_remove.append(index)
+            so_line = wiz_line.sale_line_id.sudo()
+            if so_line and not wiz_line.units_included:
+                commands.append((2, so_line.id))
+            elif so_line:
+                vals = wiz_line._prepare_update_so_line_vals()
+                line = line_obj.new(origin=so_line)
+                self._update_line(line, vals)
+                new_vals = self._get_line_write_vals(line)
+                old_vals = so_line._convert_to_write(
+                    {name: so_line[name] for name in new_vals}
+                )
+                vals = {
+                    name: value
+                    for name, value in new_vals.items()
+                    if old_vals[name] != value
+                }
+                if vals:
+                    commands.append((1, so_line.id, vals))
             else:
                 sequence += 1
-                with order_form.order_line.new() as line_form:
-                    wiz_line._prepare_new_so_line(line_form, sequence)
-        # Remove at the end and in reverse order for not having problems
-        to_remove.reverse()
-        for index in to_remove:
-            order_form.order_line.remove(index)
-        order_form.save()
+                vals = wiz_line._prepare_new_so_line_vals(sequence)
+                line = line_obj.new(dict(defaults, order_id=self.order_id.id))
+                self._update_line(line, vals)
+                vals = self._get_line_write_vals(line)
+                vals.pop("order_id", None)
+                commands.append((0, 0, vals))
+        # Remove at the end, as the form view did
+        commands.sort(key=lambda command: command[0] == 2)
+        return commands
+
+    def action_accept(self):
+        """Propagate recommendations to sale order."""
+        commands = self._prepare_so_line_commands()
+        if commands:
+            self.order_id.sudo().write({"order_line": commands})
 
 
 class SaleOrderRecommendationLine(models.TransientModel):
@@ -161,6 +431,21 @@ class SaleOrderRecommendationLine(models.TransientModel):
     pricelist_id = fields.Many2one(related="wizard_id.order_id.pricelist_id")
     times_delivered = fields.Integer(readonly=True)
     units_delivered = fields.Float(readonly=True)
+    similarity = fields.Float(
+        readonly=True,
+        help="For a product never delivered to the customer, how much it is "
+        "bought by the customers of the products delivered to the customer.",
+    )
+    score = fields.Float(
+        readonly=True,
+        help="Number of times the product was delivered to the customer, "
+        "each delivery weighing less as it gets older.",
+    )
+    reorder_due = fields.Boolean(
+        "Due",
+        readonly=True,
+        help="The customer usually orders this product again by now.",
+    )
     units_included = fields.Float()
     wizard_id = fields.Many2one(
         "sale.order.recommendation",
@@ -174,19 +459,88 @@ class SaleOrderRecommendationLine(models.TransientModel):
 
     @api.depends("partner_id", "product_id", "pricelist_id", "units_included")
     def _compute_price_unit(self):
+        prices = self._get_price_units()
         for one in self:
-            one.price_unit = one.product_id.with_context(
-                partner=one.partner_id.id,
-                pricelist=one.pricelist_id.id,
-                quantity=one.units_included,
-            ).price
+            one.price_unit = prices.get(one, 0.0)
+
+    def _get_price_units(self):
+        """Return the unit price of each line, priced together with the
+        lines sharing its pricelist and partner in one pricelist rule
+        resolution, and cached for the life of the wizard."""
+        groups = defaultdict(lambda: self.browse())
+        for line in self.filtered(lambda x: x.product_id and x.pricelist_id):
+            groups[line.wizard_id, line.pricelist_id, line.partner_id] |= line
+        prices = {}
+        for (wizard, pricelist, partner), lines in groups.items():
+            cache_key = (
+                self.env.cr.dbname,
+                wizard.price_cache_key,
+                pricelist.id,
+                partner.id,
+            )
+            group_prices = {}
+            if wizard.price_cache_key:
+                group_prices = PRICE_CACHE.get(cache_key)
+                if group_prices is None:
+                    group_prices = PRICE_CACHE[cache_key] = {}
+            missing = {
+                (line.product_id, line.units_included)
+                for line in lines
+                if (line.product_id.id, line.units_included) not in group_prices
+            }
+            while missing:
+                # The prices are returned by product: one quantity per call
+                batch = dict(missing)
+                res = pricelist._compute_price_rule(
+                    [(product, qty, partner.id) for product, qty in batch.items()]
+                )
+                for product, qty in batch.items():
+                    group_prices[product.id, qty] = res[product.id][0]
+                missing -= set(batch.items())
+            for line in lines:
+                prices[line] = group_prices[line.product_id.id, line.units_included]
+        return prices
+
+    def _set_so_line_form_values(self, line_form, vals):
+        """Set values on an order line form, in order"""
+        so_line_fields = self.env["sale.order.line"]._fields
+        for name, value in vals.items():
+            field = so_line_fields[name]
+            if field.type == "many2one":
+                value = self.env[field.comodel_name].browse(value)
+            setattr(line_form, name, value)
 
     def _prepare_update_so_line(self, line_form):
-        """So we can extend SO update"""
-        line_form.product_uom_qty = self.units_included
+        """Deprecated, extend ``_prepare_update_so_line_vals`` instead
+
+        Sets its values on an order line form.
+        """
+        _logger.warning(
+            "_prepare_update_so_line is deprecated, "
+            "use _prepare_update_so_line_vals instead"
+        )
+        self._set_so_line_form_values(line_form, self._prepare_update_so_line_vals())
 
     def _prepare_new_so_line(self, line_form, sequence):
-        """So we can extend SO create"""
-        line_form.product_id = self.product_id
-        line_form.sequence = sequence
-        line_form.product_uom_qty = self.units_included
+        """Deprecated, extend ``_prepare_new_so_line_vals`` instead
+
+        Sets its values on an order line form.
+        """
+        _logger.warning(
+            "_prepare_new_so_line is deprecated, use _prepare_new_so_line_vals instead"
+        )
+        self._set_so_line_form_values(
+            line_form, self._prepare_new_so_line_vals(sequence)
+        )
+
+    def _prepare_update_so_line_vals(self):
+        """So we can extend SO update, values set in order as in the form"""
+        return {"product_uom_qty": self.units_included}
+
+    def _prepare_new_so_line_vals(self, sequence):
+        """So we can extend SO create, values set in order as in the form"""
+        return {
+            "product_id": self.product_id.id,
+            "sequence": sequence,
+            "product_uom_qty": self.units_included,
+        }